@@ -6,18 +6,39 @@ if sys.version_info[0] < 3 or (sys.version_info[0] == 3 and sys.version_info[1]
 
 import urllib.request
 import urllib.error
+import urllib.parse
+import http.client
+import ssl
 
 import os
+import io
 import json
 import time
+import threading
+import random
+import warnings
+import email.utils
+import hashlib
+import gzip
+import collections
+import sqlite3
+import concurrent.futures
+import asyncio
+import http.server
+import contextvars
+import queue
+import shutil
+import copy
+import signal
+from xml.sax.saxutils import escape as xmlEscape
 from argparse import ArgumentParser
 import pathlib
 
 
 # add the six and jsonschema packages (locally, so users don't have to know pip etc.)
+# jsonschema itself is only imported once a variant actually needs to be validated, see getSchemaValidator
 sys.path.insert(0, os.path.abspath("schema/six"))
 sys.path.insert(0, os.path.abspath("schema/"))
-import jsonschema
 
 
 # ERROR CODES
@@ -37,112 +58,1743 @@ RAPID_MODEL_ENDPOINT       = "rapidmodel/{id}"
 
 
 # ################################ #
-#         Helper Functions         #
+#     Persistent HTTP Transport    #
 # ################################ #
 
-def executeServerRequest(request):
-    try:
-        response = urllib.request.urlopen(request)
-    except urllib.error.URLError as e:
-        print("******************************************************")
-        if hasattr(e, "reason"):
-            print("ERROR: Failed to fulfill the request.")
-            print("Error code: ", e.code)
-            print("Reason: ", e.reason)
-        elif hasattr(e, "code"):
-            print("ERROR: The server couldn't fulfill the request.")
-            print("Error code: ", e.code)
-        try:
-            errorLines = e.readlines()
+# requests that don't set their own user agent are sent with the one urllib would use
+DEFAULT_USER_AGENT  = "Python-urllib/%d.%d" % sys.version_info[:2]
+MAX_REDIRECTS       = 5
+UPLOAD_CHUNK_SIZE   = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+FICLONE             = 0x40049409    # ioctl for reflinks on Linux
+
+# partial downloads record their progress (at least) every DOWNLOAD_CHECKPOINT_SIZE bytes
+DOWNLOAD_CHECKPOINT_SIZE = 16 * 1024 * 1024
+
+class PooledResponse:
+    """Response of a request sent through a ConnectionPool.
+
+    The underlying connection goes back to its pool as soon as the body has been read
+    completely. Responses which are closed before that discard their connection instead,
+    since it is still in the middle of a response and can't be reused.
+    """
+
+    def __init__(self, pool, key, conn, response):
+        self.status    = response.status
+        self.reason    = response.reason
+        self.headers   = response.headers
+        self._pool     = pool
+        self._key      = key
+        self._conn     = conn
+        self._response = response
+        self._fp       = response
+
+    def getcode(self):
+        return self.status
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, amt=None):
+        data = self._fp.read(amt)
+        self._releaseIfDone()
+        return data
+
+    def readinto(self, b):
+        n = self._fp.readinto(b)
+        self._releaseIfDone()
+        return n
+
+    def readlines(self):
+        return self.read().splitlines(True)
+
+    def preload(self):
+        # read the whole (small) body right away, so the connection can be reused immediately
+        body = self._response.read()
+        self._releaseIfDone()
+        # only preloaded responses may be compressed, see executeServerRequest
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        self._fp = io.BytesIO(body)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def _releaseIfDone(self):
+        if self._conn is not None and self._response.isclosed():
+            if self._response.will_close:
+                self._conn.close()
+            else:
+                self._pool._release(self._key, self._conn)
+            self._conn = None
+
+# #############################################################################
+
+class FileUploadBody:
+    """Request body which streams a byte range of a file from disk.
+
+    The file is sent in fixed-size chunks through a single reused buffer, so memory usage
+    doesn't depend on the file size. The body can be iterated again (e.g. if a request
+    has to be re-sent on another connection), each iteration starts at the given offset.
+    Since the body has no length known to http.client, requests must set Content-Length.
+    """
+
+    def __init__(self, path, offset=0, length=None, chunkSize=UPLOAD_CHUNK_SIZE):
+        self.path      = path
+        self.offset    = offset
+        self.length    = os.path.getsize(path) - offset if length is None else length
+        self.chunkSize = chunkSize
+
+    def __iter__(self):
+        buffer    = bytearray(min(self.chunkSize, max(self.length, 1)))
+        view      = memoryview(buffer)
+        remaining = self.length
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while remaining > 0:
+                n = f.readinto(view[:min(remaining, len(buffer))])
+                if not n:
+                    raise IOError("File \"" + self.path + "\" ended before all data could be sent.")
+                remaining -= n
+                # the chunk is sent completely before the buffer is filled again
+                yield view[:n]
+
+# #############################################################################
+
+class ConnectionPool:
+    """Thread-safe pool of persistent (keep-alive) HTTP connections, kept per host.
+
+    Consecutive requests to the same host reuse an idle connection instead of paying for
+    a new TCP and TLS handshake each time. At most maxSize idle connections are kept per
+    host, and connections which have been idle for longer than idleTimeout seconds are
+    closed instead of being reused.
+    """
+
+    def __init__(self, maxSize=8, idleTimeout=60.0, timeout=300.0):
+        self.maxSize     = maxSize
+        self.idleTimeout = idleTimeout
+        self.timeout     = timeout
+        self._idle       = {}   # (scheme, host, port) -> list of (connection, time of release)
+        self._lock       = threading.Lock()
+        self._sslContext = ssl.create_default_context()
+        self._proxies    = urllib.request.getproxies()
+
+    def request(self, method, url, body=None, headers=None, preload=True):
+        parts  = urllib.parse.urlsplit(url)
+        port   = parts.port or (443 if parts.scheme == "https" else 80)
+        key    = (parts.scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        # plain HTTP proxies expect the full URL as request target
+        if parts.scheme == "http" and self._proxyFor(parts.scheme, parts.hostname):
+            target = url
+
+        while True:
+            conn, reused = self._acquire(key)
             try:
-                serverErrors = json.loads(errorLines[0].decode("utf-8"))
-                print("Server message: \"" + serverErrors["message"] + "\"")
-                print("Reported Errors:")
-                print(json.dumps(serverErrors["errors"], indent=2))
+                conn.request(method, target, body=body, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                # the server may have closed an idle keep-alive connection - retry on another one
+                if reused:
+                    continue
+                raise
             except:
-                # json parsing doesn't work - just try to print the string then
-                print("Server message: \"")
-                for errLine in errorLines:
-                    print(errLine.decode("utf-8"))
+                conn.close()
+                raise
+            break
+
+        pooledResponse = PooledResponse(self, key, conn, response)
+        if preload or method == "HEAD":
+            pooledResponse.preload()
+        return pooledResponse
+
+    def closeAll(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, releaseTime in connections:
+                conn.close()
+
+    def _proxyFor(self, scheme, host):
+        proxy = self._proxies.get(scheme)
+        if proxy and not urllib.request.proxy_bypass(host):
+            return urllib.parse.urlsplit(proxy)
+        return None
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                conn, releaseTime = connections.pop()
+                if now - releaseTime <= self.idleTimeout:
+                    return conn, True
+                conn.close()
+
+        scheme, host, port = key
+        proxy = self._proxyFor(scheme, host)
+        if scheme == "https":
+            if proxy:
+                conn = http.client.HTTPSConnection(proxy.hostname, proxy.port or 80, timeout=self.timeout, context=self._sslContext)
+                conn.set_tunnel(host, port)
+            else:
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._sslContext)
+        else:
+            if proxy:
+                conn = http.client.HTTPConnection(proxy.hostname, proxy.port or 80, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return conn, False
+
+    def _release(self, key, conn):
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            # evict connections that have been idle for too long
+            stale = [c for c, releaseTime in connections if now - releaseTime > self.idleTimeout]
+            connections[:] = [(c, releaseTime) for c, releaseTime in connections if now - releaseTime <= self.idleTimeout]
+            if len(connections) < self.maxSize:
+                connections.append((conn, now))
+                conn = None
+        for c in stale:
+            c.close()
+        if conn is not None:
+            conn.close()
+
+# #############################################################################
+
+def connectionPoolFor(url):
+    # API requests and requests to the (presigned) storage URLs use separate pools
+    if urllib.parse.urlsplit(url).netloc == urllib.parse.urlsplit(baseUrl).netloc:
+        return apiConnectionPool
+    return storageConnectionPool
+
+
+# ################################ #
+#             Retries              #
+# ################################ #
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+class RetryPolicy:
+    """Decides whether and when a failed request is sent again.
+
+    Requests are only repeated where that is safe: idempotent requests after connection
+    errors, server errors and rate limiting (429), non-idempotent ones only if the server
+    certainly didn't process them (429, 503, refused connections). The delay between
+    attempts grows exponentially with decorrelated jitter, unless the server asks for a
+    specific delay with Retry-After. Besides the attempts per request, the total number
+    of retries per run is limited by a budget, so an unavailable server can't stall a
+    whole batch. The counters of retries per reason are kept for the end-of-run summary.
+    """
+
+    RETRYABLE_CODES = (429, 500, 502, 503, 504)
+    REJECTED_CODES  = (429, 503)
+
+    def __init__(self, maxAttempts=5, baseDelay=1.0, maxDelay=60.0, budget=1000):
+        self.maxAttempts = maxAttempts
+        self.baseDelay   = baseDelay
+        self.maxDelay    = maxDelay
+        self.budget      = budget
+        self.retries     = 0
+        self.exhausted   = 0
+        self.reasons     = {}
+        self._lock       = threading.Lock()
+
+    def shouldRetry(self, attempt, idempotent, code=None, error=None):
+        if error is not None:
+            retryable = idempotent or isinstance(error, ConnectionRefusedError)
+            reason    = type(error).__name__
+        else:
+            retryable = code in RetryPolicy.REJECTED_CODES or (idempotent and code in RetryPolicy.RETRYABLE_CODES)
+            reason    = str(code)
+        if not retryable:
+            return False
+
+        with self._lock:
+            if attempt >= self.maxAttempts or self.retries >= self.budget:
+                self.exhausted += 1
+                return False
+            self.retries        += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return True
+
+    def nextDelay(self, previousDelay, retryAfter=None):
+        if retryAfter is not None:
+            return retryAfter
+        # decorrelated jitter: a random delay between the base delay and three times the previous one
+        return min(self.maxDelay, random.uniform(self.baseDelay, max(self.baseDelay, previousDelay * 3)))
+
+    def summary(self):
+        reasons = ", ".join(reason + ": " + str(count) for reason, count in sorted(self.reasons.items()))
+        return str(self.retries) + " retried requests (" + reasons + "), " + str(self.exhausted) + " requests out of retries"
+
+# #############################################################################
+
+def parseRetryAfter(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value.strip())
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ################################ #
+#          Rate Limiting           #
+# ################################ #
+
+class TokenBucket:
+    """Process-wide token bucket limiting the rate of requests to the API host.
+
+    Each request takes one token, tokens are refilled at the current rate up to a burst
+    size. The rate adapts to the server: it is halved (at most once per second) when the
+    server answers with 429, and grows back towards the configured rate with each request
+    that succeeds, so that the client settles just below the server's limit.
+    """
+
+    def __init__(self, rate, burst, minRate):
+        self.maxRate       = rate
+        self.minRate       = min(minRate, rate)
+        self.rate          = rate
+        self.burst         = burst
+        self.tokens        = burst
+        self.throttled     = 0
+        self._lastRefill   = time.monotonic()
+        self._lastDecrease = 0.0
+        self._lock         = threading.Lock()
+
+    def reserve(self):
+        # take a token, and return how long the caller has to wait until it is actually available
+        with self._lock:
+            now              = time.monotonic()
+            self.tokens      = min(self.burst, self.tokens + (now - self._lastRefill) * self.rate)
+            self._lastRefill = now
+            self.tokens     -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def onThrottled(self):
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self._lastDecrease >= 1.0:
+                self.rate          = max(self.minRate, self.rate / 2)
+                self._lastDecrease = now
+
+    def onSuccess(self):
+        with self._lock:
+            self.rate = min(self.maxRate, self.rate + self.maxRate / 50)
+
+# #############################################################################
+
+def rateLimiterFor(method, url):
+    # only requests to the API host are limited - status polls and other (mutating) calls separately
+    if connectionPoolFor(url) is not apiConnectionPool:
+        return None
+    if method in ("GET", "HEAD"):
+        return pollingRateLimiter
+    return mutatingRateLimiter
+
+
+# ################################ #
+#          Status Polling          #
+# ################################ #
+
+class StatusPoller:
+    """Polls the status of all outstanding base assets (raw models) and rapid models.
+
+    Instead of one polling loop per job, jobs register the ID they wait for and get a future,
+    which is resolved with the final status JSON (or None, if the job failed). A single thread
+    schedules the status requests - each ID is checked every rawModelInterval/rapidModelInterval
+    seconds, with at most maxInFlight requests at once - so the number of status requests is
+    bounded by the polling budget instead of growing with the number of jobs.
+
+    If adaptive, the interval of each job follows its progress instead: the completion time is
+    estimated from the progress reported so far, and the job is checked again halfway to it -
+    so polls become more frequent towards the end. While the progress doesn't change, the
+    interval grows. Jobs which don't report any progress (base assets) are checked at the fixed
+    interval. All intervals stay between minInterval and maxInterval.
+    """
+
+    def __init__(self, maxInFlight, rawModelInterval, rapidModelInterval, adaptive=False, minInterval=0.5, maxInterval=30.0):
+        self.maxInFlight = max(1, maxInFlight)
+        self.intervals   = {"rawmodel": rawModelInterval, "rapidmodel": rapidModelInterval}
+        self.adaptive    = adaptive
+        self.minInterval = min(minInterval, rawModelInterval, rapidModelInterval)
+        self.maxInterval = max(maxInterval, rawModelInterval, rapidModelInterval)
+        self.polls       = 0
+        self.jobs        = 0
+        self._watches    = []
+        self._inFlight   = 0
+        self._condition  = threading.Condition()
+        self._executor   = None
+        self._thread     = None
+        self._stopped    = False
+
+    def watch(self, kind, id, statusURL, accessToken, check):
+        # check(rJSON) is called with each status: True - finished, False - keep polling, None - failed
+        watch = {"kind": kind, "id": id, "url": statusURL, "token": accessToken, "check": check,
+                 "future": concurrent.futures.Future(), "context": contextvars.copy_context(),
+                 "due": time.monotonic(), "polling": False, "delay": self.intervals[kind], "history": []}
+        with self._condition:
+            if self._stopped:
+                watch["future"].cancel()
+                return watch["future"]
+            self.jobs += 1
+            if self._thread is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.maxInFlight)
+                self._thread   = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._watches.append(watch)
+            self._condition.notify()
+        return watch["future"]
+
+    def notify(self, kind, id):
+        # check the job right away, e.g. because the server has announced that it is finished
+        found = 0
+        with self._condition:
+            for watch in self._watches:
+                if str(watch["id"]) == str(id) and (kind is None or watch["kind"] == kind):
+                    watch["due"] = 0.0
+                    found       += 1
+            self._condition.notify()
+        return found
+
+    def cancel(self):
+        # stops waiting for all jobs (e.g. when the run is interrupted), their futures are cancelled
+        with self._condition:
+            self._stopped = True
+            for watch in self._watches:
+                watch["future"].cancel()
+            self._watches = []
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown()
+
+    def _run(self):
+        with self._condition:
+            while not self._stopped:
+                now = time.monotonic()
+                due = sorted((w for w in self._watches if not w["polling"] and w["due"] <= now), key=lambda w: w["due"])
+                for watch in due[:self.maxInFlight - self._inFlight]:
+                    watch["polling"] = True
+                    self._inFlight  += 1
+                    # requests and checks run in the context of the job, so that its output is labelled
+                    self._executor.submit(watch["context"].run, self._poll, watch)
+
+                waiting = [w["due"] for w in self._watches if not w["polling"]]
+                timeout = None
+                if waiting and self._inFlight < self.maxInFlight:
+                    timeout = max(0.01, min(waiting) - now)
+                self._condition.wait(timeout)
+
+    def _poll(self, watch):
+        reqHeaders  = {'Authorization' : 'Bearer ' + watch["token"],
+                       'Content-Type' : 'application/json'}
+        req         = urllib.request.Request(watch["url"], headers=reqHeaders)
+        try:
+            rJSON, code = getServerRequestJSON(req)
+
+            # still too many requests after all retries? keep waiting for the result anyway
+            if code == 429:
+                finished = False
+            elif rJSON == None:
+                finished = None
+            else:
+                finished = watch["check"](rJSON)
+        except Exception as e:
+            # e.g. an unexpected response - the job fails, but the slot is released in any case
+            print("Error: Could not check the status of " + watch["kind"] + " " + str(watch["id"]) + " (" + repr(e) + ").")
+            rJSON    = None
+            finished = None
+
+        with self._condition:
+            self.polls     += 1
+            self._inFlight -= 1
+            watch["polling"] = False
+            if watch["future"].cancelled():
+                finished = False
+            elif finished == False:
+                watch["due"] = time.monotonic() + self._nextDelay(watch, rJSON)
+            else:
+                self._watches.remove(watch)
+            self._condition.notify()
+
+        if finished != False:
+            watch["future"].set_result(rJSON if finished else None)
+
+    def _nextDelay(self, watch, rJSON):
+        if not self.adaptive:
+            return self.intervals[watch["kind"]]
+
+        now      = time.monotonic()
+        data     = rJSON["data"] if rJSON and "data" in rJSON else {}
+        progress = data.get("progress")
+        step     = data.get("processing_step")
+        history  = watch["history"]
+        delay    = self.intervals[watch["kind"]]
+
+        if isinstance(progress, (int, float)):
+            # back off while the progress doesn't change - unless a new processing step has started
+            if history and step == history[-1][2] and progress == history[-1][1]:
+                delay = watch["delay"] * 1.5
+            history.append((now, progress, step))
+            del history[:-20]
+
+            # estimate the completion time from the average progress rate over the recorded history
+            if progress > history[0][1] and progress < 100:
+                rate  = (progress - history[0][1]) / (now - history[0][0])
+                delay = (100 - progress) / rate / 2
+
+        watch["delay"] = max(self.minInterval, min(self.maxInterval, delay))
+        return watch["delay"]
+
+
+# ################################ #
+#         Webhook Receiver         #
+# ################################ #
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    # notifications are JSON objects like {"kind": "rapidmodel", "id": 123}, "kind" is optional
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        length   = int(self.headers.get("Content-Length", 0) or 0)
+        body     = self.rfile.read(length)
+
+        if self.path.split("?")[0] != receiver.path or (receiver.secret and self.headers.get("X-RPDC-Token") != receiver.secret):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        try:
+            notification = json.loads(body.decode("utf8"))
+            kind         = notification.get("kind")
+            id           = notification["id"]
+        except (ValueError, KeyError, AttributeError):
+            self.send_response(400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        receiver.notifications += 1
+        statusPoller.notify(kind, id)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+# #############################################################################
+
+class WebhookReceiver:
+    """Small HTTP listener for job notifications. Each notification makes the status poller check
+    the job right away, so that only the (slow) fallback polling is left for jobs without one."""
+
+    def __init__(self, host, port, path, secret):
+        self.path          = path
+        self.secret        = secret
+        self.notifications = 0
+        self.server        = http.server.ThreadingHTTPServer((host, port), WebhookHandler)
+        self.server.daemon_threads = True
+        self.server.receiver       = self
+        self.thread        = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://" + host + ":" + str(port) + self.path
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ################################ #
+#          Console Output          #
+# ################################ #
+
+# label of the input file processed by the current thread, see processModelFileJob
+currentJobLabel = contextvars.ContextVar("currentJobLabel", default="")
+
+class JobOutput:
+    """Wraps stdout so that each line printed while processing an input file starts with the
+    label of that file - this keeps the output readable when several files are processed at once."""
+
+    def __init__(self, stream):
+        self.stream  = stream
+        self.lock    = threading.Lock()
+        self.pending = {}
+
+    def write(self, text):
+        label = currentJobLabel.get()
+        if not label:
+            return self.stream.write(text)
+
+        # print() writes a line in several pieces, so lines are only passed on once they are complete
+        key = threading.get_ident()
+        with self.lock:
+            lines = (self.pending.pop(key, "") + text).split("\n")
+            if lines[-1]:
+                self.pending[key] = lines[-1]
+            for line in lines[:-1]:
+                self.stream.write(label + line.split("\r")[-1] + "\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+# #############################################################################
+
+def submitInJobContext(executor, fn, *args):
+    # worker threads don't inherit context variables, so each task runs in a copy of the caller's context
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# #############################################################################
+
+def collectResults(futures):
+    # if waiting is interrupted (e.g. by Ctrl+C), the tasks which haven't been started yet are cancelled -
+    # otherwise leaving the executor would still run all of them (cancel_futures needs Python 3.9)
+    try:
+        return [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+# ################################ #
+#         Helper Functions         #
+# ################################ #
+
+def sendRequest(method, url, data, headers, stream):
+    for redirects in range(MAX_REDIRECTS + 1):
+        response = connectionPoolFor(url).request(method, url, data, headers, preload=not stream)
+        location = response.getheader("Location")
+        if response.status not in (301, 302, 303, 307, 308) or not location or redirects == MAX_REDIRECTS:
+            break
+        response.close()
+        url = urllib.parse.urljoin(url, location)
+        if response.status == 303 or (response.status in (301, 302) and method == "POST"):
+            method = "GET"
+            data   = None
+            headers = {k: v for k, v in headers.items() if k.lower() not in ("content-type", "content-length")}
+    return response
+
+# #############################################################################
+
+def printServerError(code, reason, errorLines):
+    print("******************************************************")
+    print("ERROR: The server couldn't fulfill the request.")
+    print("Error code: ", code)
+    print("Reason: ", reason)
+    if errorLines is None:
+        # we don't know how to parse the content
+        print("Server message could not be read.")
+    else:
+        try:
+            serverErrors = json.loads(errorLines[0].decode("utf-8"))
+            print("Server message: \"" + serverErrors["message"] + "\"")
+            print("Reported Errors:")
+            print(json.dumps(serverErrors["errors"], indent=2))
         except:
-            # we don't know how to parse the content
-            print(e.readlines())
+            # json parsing doesn't work - just try to print the string then
+            print("Server message: \"")
+            for errLine in errorLines:
+                print(errLine.decode("utf-8", "replace"))
+    print("******************************************************")
+
+# #############################################################################
+
+def executeServerRequest(request, stream=False, idempotent=None):
+    url     = request.full_url
+    method  = request.get_method()
+    data    = request.data
+    headers = dict(request.header_items())
+
+    if not request.has_header("User-agent"):
+        headers["User-agent"] = DEFAULT_USER_AGENT
+    if data is not None and not request.has_header("Content-type"):
+        headers["Content-type"] = "application/x-www-form-urlencoded"
+    # API responses may be compressed - they are small and read completely, see PooledResponse.preload
+    if not stream and not request.has_header("Accept-encoding") and connectionPoolFor(url) is apiConnectionPool:
+        headers["Accept-Encoding"] = "gzip"
+
+    # unless the caller knows better, only the HTTP semantics tell whether a request can be repeated
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    rateLimiter = rateLimiterFor(method, url)
+
+    attempt = 1
+    delay   = 0
+    while True:
+        response = None
+        error    = None
+        if rateLimiter:
+            rateLimiter.acquire()
+        try:
+            response = sendRequest(method, url, data, headers, stream)
+        except (OSError, http.client.HTTPException) as e:
+            error = e
+
+        if rateLimiter and response:
+            if response.status == 429:
+                rateLimiter.onThrottled()
+            elif response.status < 400:
+                rateLimiter.onSuccess()
+
+        if error is None and response.status < 400:
+            break
+        if not retryPolicy.shouldRetry(attempt, idempotent, response.status if response else None, error):
+            break
+
+        retryAfter = None
+        if response:
+            retryAfter = parseRetryAfter(response.getheader("Retry-After"))
+            response.close()
+        delay = retryPolicy.nextDelay(delay, retryAfter)
+        print("Request failed (" + (str(response.status) if response else str(error)) + "), retrying in {:.1f} seconds ...".format(delay))
+        time.sleep(delay)
+        attempt += 1
+
+    if error is not None:
+        print("******************************************************")
+        print("ERROR: Failed to fulfill the request.")
+        print("Reason: ", error)
         print("******************************************************")
+        return None, None
 
-        return None, e.code
+    if response.status >= 400:
+        try:
+            errorLines = response.readlines()
+        except (OSError, http.client.HTTPException):
+            errorLines = None
+        response.close()
+        printServerError(response.status, response.reason, errorLines)
+
+        return None, response.status
 
     return response, response.getcode()
 
 # #############################################################################
 
+class ResponseCache:
+    """Last JSON result of GET requests to the API, with the validators (ETag / Last-Modified)
+    the server sent along. Repeated requests (status polls) send these validators, so that the
+    server can answer with 304 Not Modified instead of sending (and us parsing) the same JSON."""
+
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.hits       = 0
+        self._entries   = collections.OrderedDict()
+        self._lock      = threading.Lock()
+
+    def validatorHeaders(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return {}
+            self._entries.move_to_end(url)
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["lastModified"]:
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def notModified(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self.hits += 1
+        return entry["rJSON"] if entry is not None else None
+
+    def store(self, url, response, rJSON):
+        etag         = response.getheader("ETag")
+        lastModified = response.getheader("Last-Modified")
+        with self._lock:
+            if not etag and not lastModified:
+                self._entries.pop(url, None)
+                return
+            self._entries[url] = {"etag": etag, "lastModified": lastModified, "rJSON": rJSON}
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+# #############################################################################
+
 def getServerRequestJSON(request):
+    # GET requests to the API are sent conditionally, if there is an earlier result to compare with
+    url         = request.full_url
+    conditional = request.get_method() == "GET" and connectionPoolFor(url) is apiConnectionPool
+    if conditional:
+        for name, value in responseCache.validatorHeaders(url).items():
+            request.add_header(name, value)
+
     response, code = executeServerRequest(request)
 
     if not response:
         return None, code
 
+    if conditional and code == 304:
+        response.read()
+        rJSON = responseCache.notModified(url)
+        if rJSON is not None:
+            return rJSON, code
+        print("ERROR: Server reported an unchanged result, but there is no earlier one.")
+        return None, code
+
     res = response.read().decode("utf8")
     try:
         rJSON = json.loads(res)
     except:
         print("ERROR: Could not parse the result from server.")
 
+    if conditional:
+        responseCache.store(url, response, rJSON)
+
     return rJSON, response.getcode()
 
 # #############################################################################
 
-def downloadFile(fileURL, outputFilePath):
-    req = urllib.request.Request(fileURL)
-    response, code = executeServerRequest(req)
+def preallocateFile(f, size):
+    # reserve the disk space upfront where the platform supports it, to reduce fragmentation
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
+
+# #############################################################################
+
+def formatTransferRate(numBytes, seconds):
+    return "{:.2f} MB, {:.2f} MB/s".format(numBytes / 1e6, numBytes / 1e6 / max(seconds, 1e-6))
+
+# #############################################################################
+
+def copyResponseToFile(response, f, checkpoint=None, hasher=None):
+    # copy the response to the file in chunks, through one reused buffer (and hash them on the way)
+    buffer         = bytearray(DOWNLOAD_CHUNK_SIZE)
+    view           = memoryview(buffer)
+    received       = 0
+    nextCheckpoint = DOWNLOAD_CHECKPOINT_SIZE
+    while True:
+        n = response.readinto(buffer)
+        if not n:
+            break
+        f.write(view[:n])
+        if hasher:
+            hasher.update(view[:n])
+        received += n
+        if checkpoint and received >= nextCheckpoint:
+            f.flush()
+            os.fsync(f.fileno())
+            checkpoint(received)
+            nextCheckpoint += DOWNLOAD_CHECKPOINT_SIZE
+    if checkpoint and received:
+        f.flush()
+        os.fsync(f.fileno())
+        checkpoint(received)
+    return received
+
+# #############################################################################
+
+def urlWithoutQuery(url):
+    # presigned URLs of the same file differ in their signature only
+    return urllib.parse.urlsplit(url)._replace(query="", fragment="").geturl()
+
+# #############################################################################
+
+def writeJSONAtomically(path, obj, private=False):
+    # write to a temporary file first, so that a crash never leaves a broken file behind -
+    # private files can only be read by the user running the script
+    tmpPath = path + ".tmp"
+    opener  = (lambda file, flags: os.open(file, flags, 0o600)) if private else None
+    with open(tmpPath, 'w', opener=opener) as f:
+        json.dump(obj, f)
+    os.replace(tmpPath, path)
+
+# #############################################################################
+
+class DownloadState:
+    """Progress of a partial download, stored next to its .part file as <name>.part.json.
+
+    Records URL (without query), size and ETag of the downloaded file and the byte ranges
+    which have already been written to the .part file, so that an interrupted download
+    can be continued with range requests for the missing parts only.
+    """
+
+    def __init__(self, path, url, size, etag):
+        self.path    = path
+        self.url     = url
+        self.size    = size
+        self.etag    = etag
+        self.ranges  = []      # sorted, non-overlapping [start, end] pairs (inclusive)
+        self.changed = False   # set when the file on the server doesn't match the .part file anymore
+        self._lock   = threading.Lock()
+
+    @staticmethod
+    def load(path, partPath, url):
+        try:
+            with open(path) as f:
+                stateJSON = json.load(f)
+            if urlWithoutQuery(stateJSON["url"]) != urlWithoutQuery(url) or os.path.getsize(partPath) != stateJSON["size"]:
+                return None
+            state        = DownloadState(path, url, stateJSON["size"], stateJSON["etag"])
+            state.ranges = stateJSON["ranges"]
+            return state
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def addRange(self, start, end):
+        with self._lock:
+            merged = []
+            for r in sorted(self.ranges + [[start, end]]):
+                if merged and r[0] <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], r[1])
+                else:
+                    merged.append(list(r))
+            self.ranges = merged
+            self._save()
+
+    def missingRanges(self, rangeSize, fromByte=0):
+        with self._lock:
+            missing = []
+            pos     = fromByte
+            for start, end in self.ranges + [[self.size, self.size]]:
+                while pos < min(start, self.size):
+                    rangeEnd = min(pos + rangeSize, start)
+                    missing.append((pos, rangeEnd - 1))
+                    pos = rangeEnd
+                pos = max(pos, end + 1)
+            return missing
+
+    def isComplete(self):
+        return len(self.missingRanges(max(self.size, 1))) == 0
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _save(self):
+        # presigned URLs carry their signature in the query - it must not end up on disk
+        writeJSONAtomically(self.path, {"url": urlWithoutQuery(self.url), "size": self.size, "etag": self.etag, "ranges": self.ranges})
+
+# #############################################################################
+
+def downloadFileRange(fileURL, partPath, start, end, state):
+    reqHeaders = {'Range' : 'bytes=' + str(start) + '-' + str(end)}
+    if state.etag:
+        # if the file has changed in the meantime, the server sends all of it instead of the range
+        reqHeaders['If-Range'] = state.etag
+    req = urllib.request.Request(fileURL, headers=reqHeaders)
+    response, code = executeServerRequest(req, stream=True)
     if not response:
-        print("Error: No data received to write output file \"" + outputFilePath + "\".")
         return False
+    contentRange = response.getheader("Content-Range", "")
+    if code != 206 or contentRange.split("/")[-1] != str(state.size):
+        print("Error: Output file \"" + partPath + "\" doesn't match the partial download anymore, download has to start over.")
+        state.changed = True
+        response.close()
+        return False
+
     try:
-        with open(outputFilePath, 'wb') as f:
-            f.write(response.read())
-    except:
-       print("Error: Cannot write to output file \"" + outputFilePath + "\".")
-       return False
+        # each range is written at its own position, through its own file handle
+        with open(partPath, 'r+b') as f:
+            f.seek(start)
+            received = copyResponseToFile(response, f, lambda n: state.addRange(start, start + n - 1))
+    except (OSError, http.client.HTTPException) as e:
+        print("Error: Download of output file \"" + partPath + "\" failed (" + str(e) + ").")
+        response.close()
+        return False
+
+    if received != end - start + 1:
+        print("Error: Download of output file \"" + partPath + "\" is incomplete (bytes " + str(start) + "-" + str(end) + ").")
+        return False
+    return True
+
+# #############################################################################
+
+def startDownload(fileURL, partPath):
+    # if parallel downloads are enabled, ask for the first range only - this also tells whether
+    # the server supports ranges at all, servers without support simply send the whole file
+    reqHeaders = {}
+    if downloadParallelism > 1:
+        reqHeaders['Range'] = 'bytes=0-' + str(downloadRangeSize - 1)
+    req = urllib.request.Request(fileURL, headers=reqHeaders)
+    response, code = executeServerRequest(req, stream=True)
+    if not response and code == 416:
+        # empty files have no satisfiable range
+        response, code = executeServerRequest(urllib.request.Request(fileURL), stream=True)
+    if not response:
+        print("Error: No data received to write output file \"" + partPath + "\".")
+        return False, None, None
+
+    contentLength = response.getheader("Content-Length")
+    expectedSize  = int(contentLength) if contentLength else None
+    totalSize     = expectedSize
+    if code == 206:
+        contentRange = response.getheader("Content-Range", "")
+        totalSize    = int(contentRange.split("/")[-1]) if contentRange.split("/")[-1].isdigit() else None
+
+    # only downloads from servers which support ranges can be resumed
+    state = None
+    if totalSize is not None and (code == 206 or response.getheader("Accept-Ranges") == "bytes"):
+        state = DownloadState(partPath + ".json", fileURL, totalSize, response.getheader("ETag"))
+
+    rangeFutures = []
+    executor     = None
+    received     = -1
+    hasher       = hashlib.sha256()
+    try:
+        with open(partPath, 'wb') as f:
+            if preallocateDownloads and totalSize:
+                preallocateFile(f, totalSize)
+            checkpoint = None
+            if state:
+                f.truncate(totalSize)
+                state.save()
+                checkpoint = lambda n: state.addRange(0, n - 1)
+                # fetch everything after the first range on additional connections
+                ranges = state.missingRanges(downloadRangeSize, expectedSize)
+                if ranges:
+                    executor     = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, downloadParallelism - 1))
+                    rangeFutures = [submitInJobContext(executor, downloadFileRange, fileURL, partPath, rangeStart, rangeEnd, state) for rangeStart, rangeEnd in ranges]
+            # the content can only be hashed on the way if it arrives in one piece
+            received = copyResponseToFile(response, f, checkpoint, hasher if not rangeFutures else None)
+            if not state:
+                # a preallocated file may be larger than what was actually received
+                f.truncate(received)
+    except (OSError, http.client.HTTPException) as e:
+        print("Error: Download of output file \"" + partPath + "\" failed (" + str(e) + ").")
+        response.close()
+    finally:
+        if executor:
+            if received < 0:
+                for future in rangeFutures:
+                    future.cancel()
+            executor.shutdown(wait=True)
+
+    if received < 0 or not all(future.result() for future in rangeFutures if not future.cancelled()):
+        return False, state, None
+
+    if expectedSize is not None and received != expectedSize:
+        print("Error: Download of output file \"" + partPath + "\" is incomplete (" + str(received) + " of " + str(expectedSize) + " bytes).")
+        return False, state, None
+
+    return True, state, hasher.hexdigest() if not rangeFutures else None
+
+# #############################################################################
+
+def resumeDownload(fileURL, partPath, state):
+    missing = state.missingRanges(downloadRangeSize)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, downloadParallelism)) as executor:
+        results = [future.result() for future in [submitInJobContext(executor, downloadFileRange, fileURL, partPath, r[0], r[1], state) for r in missing]]
+    return all(results) and state.isComplete()
+
+# #############################################################################
+
+def hashFileContent(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+# #############################################################################
+
+def reflinkFile(source, destination):
+    # copy-on-write clone of the file (Linux only, on file systems like Btrfs and XFS)
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        return False
+
+# #############################################################################
+
+class OutputDeduplicator:
+    """Remembers the content of the output files written in this run, so that output files with
+    the same content are only stored once: as reflinks of the first one where the file system
+    supports it (so that each file can still be changed on its own), otherwise as hardlinks.
+    """
+
+    def __init__(self, hardlinks):
+        self.hardlinks  = hardlinks
+        self.linked     = 0
+        self.savedBytes = 0
+        self._files     = {}    # sha256 -> (path, size, mtime_ns) of the first file with this content
+        self._lock      = threading.Lock()
+
+    def deduplicate(self, path, sha256):
+        # replaces path with a link of an earlier file with the same content, if there is one
+        fileStat = os.stat(path)
+        with self._lock:
+            earlier = self._files.get(sha256)
+            if earlier is not None:
+                try:
+                    earlierStat = os.stat(earlier[0])
+                    if (earlierStat.st_size, earlierStat.st_mtime_ns) != earlier[1:]:
+                        earlier = None    # changed in the meantime
+                except OSError:
+                    earlier = None
+            if earlier is None or earlier[0] == path:
+                self._files[sha256] = (path, fileStat.st_size, fileStat.st_mtime_ns)
+                return None
+        method = self.link(earlier[0], path)
+        if method != "copy":
+            print("Output file \"" + path + "\" has the same content as \"" + earlier[0] + "\", stored as " + method + ".")
+        return method
+
+    def link(self, source, destination):
+        # store destination as reflink or hardlink of source, or as a copy if neither is possible
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            return "hardlink"
+        tmpPath = destination + ".link"
+        if reflinkFile(source, tmpPath):
+            method = "reflink"
+        else:
+            method = "copy"
+            if self.hardlinks:
+                try:
+                    os.link(source, tmpPath)
+                    method = "hardlink"
+                except OSError:
+                    pass
+            if method == "copy":
+                shutil.copyfile(source, tmpPath)
+        os.replace(tmpPath, destination)
+        if method != "copy":
+            with self._lock:
+                self.linked     += 1
+                self.savedBytes += os.path.getsize(destination)
+        return method
 
+# #############################################################################
+
+def copyOutputFile(source, destination):
+    # results shared by several variants are linked where possible
+    if outputDeduplicator is not None:
+        return outputDeduplicator.link(source, destination)
+    shutil.copyfile(source, destination)
+    return "copy"
+
+# #############################################################################
+
+def downloadFile(fileURL, outputFilePath):
+    startTime = time.monotonic()
+
+    # data goes to <name>.part first, which is renamed once the download is complete
+    partPath = outputFilePath + ".part"
+    state    = DownloadState.load(partPath + ".json", partPath, fileURL)
+
+    success = False
+    digest  = None
+    delay   = 0
+    for attempt in range(downloadRetries + 1):
+        if attempt > 0:
+            delay = retryPolicy.nextDelay(delay)
+            print("Retrying download of output file \"" + outputFilePath + "\" in {:.1f} seconds ...".format(delay))
+            time.sleep(delay)
+        if state is not None and not state.changed:
+            print("Resuming download of output file \"" + outputFilePath + "\" ...")
+            success = resumeDownload(fileURL, partPath, state)
+        else:
+            success, state, digest = startDownload(fileURL, partPath)
+        if success:
+            break
+
+    if not success:
+        return False
+
+    try:
+        os.replace(partPath, outputFilePath)
+    except OSError:
+        print("Error: Cannot write to output file \"" + outputFilePath + "\".")
+        return False
+    if state is not None:
+        state.remove()
+
+    print("Downloaded \"" + outputFilePath + "\" (" + formatTransferRate(os.path.getsize(outputFilePath), time.monotonic() - startTime) + ").")
+
+    # files downloaded in ranges or resumed are hashed afterwards
+    if outputDeduplicator is not None:
+        try:
+            outputDeduplicator.deduplicate(outputFilePath, digest if digest is not None else hashFileContent(outputFilePath))
+        except OSError as e:
+            print("Warning: Could not deduplicate output file \"" + outputFilePath + "\" (" + str(e) + ").")
     return True
 
 # #############################################################################
 
-def getUploadURLs(fileExt, accessToken, modelLabel, baseUrl):
+def getMultipartPartCount(modelFile):
+    if not multipartUploadEnabled:
+        return 1
+    try:
+        fileSize = os.path.getsize(modelFile)
+    except OSError:
+        return 1
+    if fileSize < multipartThreshold:
+        return 1
+    return -(-fileSize // multipartPartSize)
+
+# #############################################################################
+
+def getUploadURLs(fileExt, accessToken, modelLabel, baseUrl, partCount=1):
     reqHeaders = {'Authorization' : 'Bearer ' + accessToken,
                   'content-type' : 'application/json'}
 
     payload = {"filenames": ["rapid" + fileExt],"model_name": modelLabel}
+    # ask for one presigned URL per part - servers without multipart support just return the single upload URL
+    if partCount > 1:
+        payload["multipart"] = {"part_count": partCount}
     data = json.dumps(payload).encode("utf8")
     print("Obtaining Signed Upload URLs ...")
     req = urllib.request.Request(baseUrl+PRESIGNED_FETCH_ENDPOINT, data, headers=reqHeaders)
     responseJSON, code = getServerRequestJSON(req)
     return responseJSON
 
+def getMultipartURLs(uploadURLs, fileExt):
+    # presigned URLs for the parts of the file, if the server provided them
+    multipartURLs = uploadURLs['links'].get('s3_multipart_upload_urls', {}).get('rapid' + fileExt)
+    return multipartURLs if multipartURLs and len(multipartURLs["parts"]) > 1 else None
+
+# #############################################################################
+
+class UploadState:
+    """Checkpoint of a base asset upload, stored as <cacheDir>/uploads/<path hash>.json.
+
+    Records the raw model ID and upload URLs obtained from the server, the parts which
+    have already been uploaded and whether the upload has been finalized, so that an
+    interrupted upload is resumed by the next run instead of starting over. The checkpoint
+    only applies as long as the model file keeps its size and modification time. Only
+    multipart uploads are checkpointed - a single upload request can't be continued anyway.
+
+    Unlike download URLs (see DownloadState), the upload URLs are stored with their
+    signatures, since the missing parts can't be uploaded without them. The checkpoint can
+    therefore only be read by the user running the script, and it is removed as soon as the
+    upload is complete or can't be continued.
+    """
+
+    def __init__(self, path, modelFile, uploadURLs):
+        self.path       = path
+        self.uploadURLs = uploadURLs
+        self.fileStat   = UploadState.fileStatOf(modelFile)
+        self.parts      = {}      # part index (as string) -> ETag
+        self.uploaded   = False
+        self.finalized  = False
+        self.removed    = False   # set when the upload can't be continued anymore, or is complete
+        self._lock      = threading.Lock()
+
+    @staticmethod
+    def fileStatOf(modelFile):
+        fileStat = os.stat(modelFile)
+        return [fileStat.st_size, fileStat.st_mtime_ns]
+
+    @staticmethod
+    def pathFor(modelFile):
+        return os.path.join(cacheDir, "uploads", hashlib.sha1(os.path.abspath(modelFile).encode("utf8")).hexdigest() + ".json")
+
+    @staticmethod
+    def load(modelFile):
+        path = UploadState.pathFor(modelFile)
+        try:
+            with open(path) as f:
+                stateJSON = json.load(f)
+            state = UploadState(path, modelFile, stateJSON["uploadURLs"])
+            if state.fileStat != stateJSON["fileStat"]:
+                state.remove()
+                return None
+            state.parts     = stateJSON["parts"]
+            state.uploaded  = stateJSON["uploaded"]
+            state.finalized = stateJSON["finalized"]
+            return state
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def create(modelFile, uploadURLs):
+        state = UploadState(UploadState.pathFor(modelFile), modelFile, uploadURLs)
+        os.makedirs(os.path.dirname(state.path), exist_ok=True)
+        state.save()
+        return state
+
+    def addPart(self, partIdx, etag):
+        with self._lock:
+            self.parts[str(partIdx)] = etag
+            self._save()
+
+    def markUploaded(self):
+        self.uploaded = True
+        self.save()
+
+    def markFinalized(self):
+        self.finalized = True
+        self.save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def remove(self):
+        self.removed = True
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _save(self):
+        writeJSONAtomically(self.path, {"uploadURLs": self.uploadURLs, "fileStat": self.fileStat, "parts": self.parts,
+                                        "uploaded": self.uploaded, "finalized": self.finalized}, private=True)
+
+# #############################################################################
+
+class SQLiteDatabase:
+    """Base class of the SQLite databases kept in the cache directory."""
+
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _execute(self, sql, parameters=()):
+        # one short-lived connection per statement, so that worker threads can share the database
+        with self._lock:
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                with db:
+                    return db.execute(sql, parameters).fetchall()
+            finally:
+                db.close()
+
+# #############################################################################
+
+class SQLiteCache(SQLiteDatabase):
+    """Base class of the caches kept in SQLite databases in the cache directory.
+
+    Also remembers the SHA-256 of model files, as long as their size and modification time
+    stay the same, so that unchanged files don't have to be read again to identify them.
+    """
+
+    def __init__(self, path):
+        SQLiteDatabase.__init__(self, path)
+        self._execute("CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                      "mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL)")
+
+    def hashFile(self, modelFile):
+        path     = os.path.abspath(modelFile)
+        fileStat = os.stat(modelFile)
+        rows     = self._execute("SELECT sha256 FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?", (path, fileStat.st_size, fileStat.st_mtime_ns))
+        if rows:
+            return rows[0][0]
+
+        digest = hashFileContent(modelFile)
+        self._execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)", (path, fileStat.st_size, fileStat.st_mtime_ns, digest))
+        return digest
+
+# #############################################################################
+
+class BaseAssetCache(SQLiteCache):
+    """Index of uploaded base assets by content, stored as <cacheDir>/base-assets.sqlite.
+
+    Maps the SHA-256 of each uploaded model file to the ID of its base asset (raw model),
+    together with the time of the upload and the last time the base asset was confirmed to
+    still exist on the server. Files with the same content are not uploaded again, but the
+    existing base asset is used instead, just like with the <number>.id input mode.
+    """
+
+    def __init__(self, path):
+        SQLiteCache.__init__(self, path)
+        self._execute("CREATE TABLE IF NOT EXISTS base_assets (sha256 TEXT PRIMARY KEY, raw_model_id TEXT NOT NULL, "
+                      "upload_time REAL NOT NULL, last_confirmed REAL NOT NULL)")
+
+    def lookup(self, sha256):
+        rows = self._execute("SELECT raw_model_id FROM base_assets WHERE sha256 = ?", (sha256,))
+        return rows[0][0] if rows else None
+
+    def store(self, sha256, rawModelID):
+        now = time.time()
+        self._execute("INSERT OR REPLACE INTO base_assets VALUES (?, ?, ?, ?)", (sha256, str(rawModelID), now, now))
+
+    def confirm(self, sha256):
+        self._execute("UPDATE base_assets SET last_confirmed = ? WHERE sha256 = ?", (time.time(), sha256))
+
+    def remove(self, sha256):
+        self._execute("DELETE FROM base_assets WHERE sha256 = ?", (sha256,))
+
 # #############################################################################
 
-def uploadRawModel(modelFile, fileExt, uploadURLs, accessToken, baseUrl):
+class ResultCache(SQLiteCache):
+    """Downloaded results of earlier optimizations, stored in <cacheDir>/results/.
+
+    Results are identified by the content of the model file, the variant (with its keys in a
+    canonical order) and the content of the JSON schema the variant was validated against.
+    Running the same variant on the same model again copies the results from the cache,
+    without any requests to the API. The least recently used results are removed when the
+    cache grows larger than maxSize bytes.
+    """
+
+    def __init__(self, directory, maxSize, schemaPath):
+        SQLiteCache.__init__(self, os.path.join(directory, "index.sqlite"))
+        self.directory = directory
+        self.maxSize   = maxSize
+        self.hits      = 0
+        self.schemaHash = getSchemaHash(schemaPath)
+        self._execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, files TEXT NOT NULL, "
+                      "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+
+    def inputKeyFor(self, modelFile):
+        # base assets given by ID can't change, their ID identifies the content just as well
+        if modelFile.endswith(".id"):
+            return "id:" + os.path.basename(modelFile)[:-3]
+        return self.hashFile(modelFile)
+
+    def keyFor(self, inputKey, variant):
+        canonical = json.dumps({"input": inputKey, "variant": variant, "schema": self.schemaHash}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+    def restore(self, key, outputModelFilePrefix):
+        rows = self._execute("SELECT files FROM results WHERE key = ?", (key,))
+        if not rows:
+            return False
+        try:
+            for filenameSuffix in json.loads(rows[0][0]):
+                # output files may be hardlinks of each other, so they are replaced instead of overwritten
+                shutil.copyfile(os.path.join(self.directory, key, filenameSuffix), outputModelFilePrefix + filenameSuffix + ".tmp")
+                os.replace(outputModelFilePrefix + filenameSuffix + ".tmp", outputModelFilePrefix + filenameSuffix)
+        except OSError:
+            # the entry is incomplete, e.g. because someone removed files from the cache directory
+            self._removeEntry(key)
+            return False
+        self._execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, outputModelFilePrefix, filenameSuffixes):
+        # files are copied to a temporary directory first, so that entries are always complete
+        entryDir = os.path.join(self.directory, key)
+        tempDir  = entryDir + ".tmp" + str(threading.get_ident())
+        try:
+            shutil.rmtree(tempDir, ignore_errors=True)
+            os.makedirs(tempDir)
+            size = 0
+            for filenameSuffix in filenameSuffixes:
+                shutil.copyfile(outputModelFilePrefix + filenameSuffix, os.path.join(tempDir, filenameSuffix))
+                size += os.path.getsize(os.path.join(tempDir, filenameSuffix))
+            shutil.rmtree(entryDir, ignore_errors=True)
+            os.replace(tempDir, entryDir)
+        except OSError as e:
+            print("Could not store the results in the result cache (" + str(e) + ").")
+            shutil.rmtree(tempDir, ignore_errors=True)
+            return
+        self._execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, json.dumps(filenameSuffixes), size, time.time()))
+        self.evict()
+
+    def evict(self):
+        rows      = self._execute("SELECT key, size FROM results ORDER BY last_used DESC")
+        totalSize = 0
+        for key, size in rows:
+            totalSize += size
+            if totalSize > self.maxSize:
+                self._removeEntry(key)
+
+    def _removeEntry(self, key):
+        self._execute("DELETE FROM results WHERE key = ?", (key,))
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+# #############################################################################
+
+def restoreCachedResults(modelFile, variants, outputModelFilePrefixFor):
+    # returns the variants which still have to be produced, and the result cache key of each variant
+    inputKey          = resultCache.inputKeyFor(modelFile)
+    variantsToProduce = []
+    resultKeys        = {}
+    for variantName, variant in variants:
+        resultKeys[variantName] = resultCache.keyFor(inputKey, variant)
+        if resultCache.restore(resultKeys[variantName], outputModelFilePrefixFor(variantName)):
+            print("Using cached results for variant \"" + variantName + "\".")
+        else:
+            variantsToProduce.append((variantName, variant))
+    return variantsToProduce, resultKeys
+
+# #############################################################################
+
+def findCachedBaseAsset(modelFile, accessToken, baseUrl):
+    # returns the SHA-256 of the model file, and the ID of an existing base asset with the same content
+    sha256     = baseAssetCache.hashFile(modelFile)
+    rawModelID = baseAssetCache.lookup(sha256)
+    if rawModelID is None:
+        return sha256, None
+
+    # make sure that the base asset still exists and is ready to be used
+    usable, code = checkBaseAsset(rawModelID, accessToken, baseUrl)
+    if usable:
+        baseAssetCache.confirm(sha256)
+        print("Model file is unchanged, using existing base asset " + rawModelID + ".")
+        return sha256, rawModelID
+
+    if code is not None:
+        print("Base asset " + rawModelID + " can't be used anymore, uploading the model file again.")
+        baseAssetCache.remove(sha256)
+    return sha256, None
+
+# #############################################################################
+
+def checkBaseAsset(rawModelID, accessToken, baseUrl):
+    # returns whether the base asset exists and is ready to be used, and the status code - None,
+    # if the server couldn't be asked
+    reqHeaders  = {'Authorization' : 'Bearer ' + accessToken,
+                   'Content-Type' : 'application/json'}
+    req         = urllib.request.Request(baseUrl+BASE_ASSET_ENDPOINT.replace("{id}", str(rawModelID)), headers=reqHeaders)
+    rJSON, code = getServerRequestJSON(req)
+    if rJSON != None:
+        return rJSON["data"]["upload_status"] == "complete", code
+    return False, code if code == 404 else None
+
+# #############################################################################
+
+class Journal(SQLiteDatabase):
+    """Append-only record of what happened to each input file and variant, stored as
+    <cacheDir>/journal.sqlite (in WAL mode, so that everything recorded before a crash is kept).
+
+    Input files are identified by path, size and modification time, variants by name and
+    content. Files get the events "uploaded" (with the base asset ID) and "cleaned" (the
+    assets on the server have been deleted), variants get "submitted" (with the rapid model
+    ID), "downloaded" and "failed". With --resume, replaying the events tells what is left
+    to do for each file and variant.
+    """
+
+    def __init__(self, path):
+        SQLiteDatabase.__init__(self, path)
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, "
+                      "file TEXT NOT NULL, variant TEXT NOT NULL, state TEXT NOT NULL, server_id TEXT)")
+        self._execute("CREATE INDEX IF NOT EXISTS events_file ON events (file, seq)")
+
+    @staticmethod
+    def fileKey(modelFile):
+        if modelFile.endswith(".id"):
+            return "id:" + os.path.basename(modelFile)[:-3]
+        fileStat = os.stat(modelFile)
+        return os.path.abspath(modelFile) + ":" + str(fileStat.st_size) + ":" + str(fileStat.st_mtime_ns)
+
+    @staticmethod
+    def variantKey(variantName, variant):
+        return variantName + ":" + canonicalJSONHash(variant)
+
+    def record(self, fileKey, variantKey, state, serverID=None):
+        self._execute("INSERT INTO events (time, file, variant, state, server_id) VALUES (?, ?, ?, ?, ?)",
+                      (time.time(), fileKey, variantKey, state, str(serverID) if serverID is not None else None))
+
+    def stateOf(self, fileKey):
+        state = JournalState()
+        for variantKey, event, serverID in self._execute("SELECT variant, state, server_id FROM events WHERE file = ? ORDER BY seq", (fileKey,)):
+            state.replay(variantKey, event, serverID)
+        return state
+
+# #############################################################################
+
+class JournalState:
+    """State of one input file and its variants, as recorded in the journal."""
+
+    def __init__(self):
+        self.rawModelID = None
+        self.variants   = {}    # variant key -> (state, rapid model ID)
+
+    def replay(self, variantKey, event, serverID):
+        if variantKey != "":
+            self.variants[variantKey] = (event, serverID)
+        elif event == "uploaded":
+            self.rawModelID = serverID
+        elif event == "cleaned":
+            # the base asset and the rapid models are gone, only the downloaded results are left
+            self.rawModelID = None
+            for key in self.variants:
+                self.variants[key] = (self.variants[key][0], None)
+
+    def isDownloaded(self, variantKey):
+        return self.variants.get(variantKey, (None, None))[0] == "downloaded"
+
+    def runningRapidModelID(self, variantKey):
+        # rapid model of a variant which was submitted, but whose results haven't been downloaded
+        event, rapidModelID = self.variants.get(variantKey, (None, None))
+        return rapidModelID if event == "submitted" else None
+
+    def leftoverRapidModelIDs(self, variantKeys):
+        # rapid models of finished variants which haven't been cleaned up yet
+        # (variants optimized together share their rapid model)
+        return list(dict.fromkeys(self.variants[key][1] for key in variantKeys if self.isDownloaded(key) and self.variants[key][1] is not None))
+
+# #############################################################################
+
+def skipFinishedVariants(journalState, journalKeys, variants):
+    # returns the variants which still have to be produced, and the leftover rapid models of the others
+    remainingVariants = []
+    finishedKeys      = []
+    for variantName, variant in variants:
+        if journalState.isDownloaded(journalKeys[variantName]):
+            print("Skipping variant \"" + variantName + "\", its results have been downloaded by an earlier run.")
+            finishedKeys.append(journalKeys[variantName])
+        else:
+            remainingVariants.append((variantName, variant))
+    return remainingVariants, journalState.leftoverRapidModelIDs(finishedKeys)
+
+# #############################################################################
+
+def uploadMultipart(modelFile, multipartURLs, parallelism, uploadState=None):
+    partURLs = multipartURLs["parts"]
+    fileSize = os.path.getsize(modelFile)
+    partSize = max(1, -(-fileSize // len(partURLs)))
+    numParts = max(1, -(-fileSize // partSize))
+    codes    = []
+    sizes    = []
+
+    def uploadPart(partIdx):
+        # parts confirmed by an earlier, interrupted run don't need to be uploaded again
+        if uploadState and str(partIdx) in uploadState.parts:
+            return uploadState.parts[str(partIdx)]
+        offset = partIdx * partSize
+        body   = FileUploadBody(modelFile, offset, min(partSize, fileSize - offset))
+        req    = urllib.request.Request(partURLs[partIdx], data=body, headers={'Content-Length' : str(body.length)}, method='PUT')
+        response, code = executeServerRequest(req)
+        if response == None:
+            codes.append(code)
+            return None
+        etag = response.getheader("ETag")
+        sizes.append(body.length)
+        if uploadState:
+            uploadState.addPart(partIdx, etag)
+        return etag
+
+    if uploadState and uploadState.parts:
+        print("Resuming upload of model file, " + str(len(uploadState.parts)) + " of " + str(numParts) + " parts are already uploaded ...")
+    else:
+        print("Uploading model file in " + str(numParts) + " parts ...")
+    startTime = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        etags = [future.result() for future in [submitInJobContext(executor, uploadPart, partIdx) for partIdx in range(numParts)]]
+
+    if None in etags:
+        print("Could not upload all parts of the model file.")
+        if uploadState and (403 in codes or 404 in codes):
+            # the presigned URLs have expired, so the parts can't be completed anymore
+            print("The upload URLs are not valid anymore.")
+            uploadState.remove()
+            uploadState = None
+        if uploadState is None and "abort" in multipartURLs:
+            req = urllib.request.Request(multipartURLs["abort"], method='DELETE')
+            executeServerRequest(req)
+        return False
+
+    # assemble the parts on the server (S3 CompleteMultipartUpload)
+    partsXML = ""
+    for partIdx in range(numParts):
+        partsXML += "<Part><PartNumber>" + str(partIdx + 1) + "</PartNumber><ETag>" + xmlEscape(etags[partIdx]) + "</ETag></Part>"
+    data = ("<CompleteMultipartUpload>" + partsXML + "</CompleteMultipartUpload>").encode("utf8")
+    req  = urllib.request.Request(multipartURLs["complete"], data=data, headers={'Content-Type' : 'application/xml'}, method='POST')
+    response, code = executeServerRequest(req, idempotent=True)
+
+    if response == None:
+        print("Could not assemble the uploaded parts of the model file.")
+        if uploadState and code in (403, 404):
+            # the multipart upload has expired (or has been aborted)
+            uploadState.remove()
+        return False
+
+    print("Uploaded model file (" + formatTransferRate(sum(sizes), time.monotonic() - startTime) + ").")
+    return True
+
+# #############################################################################
+
+def uploadModelData(modelFile, fileExt, uploadURLs, uploadState=None):
     dataModel = None
 
     try:
-       dataModel = open(modelFile, 'rb')
+       dataModel = FileUploadBody(modelFile)
     except IOError:
        print("Error: cannot open model file \"" + modelFile + "\"")
        return False
 
-    url_model = uploadURLs['links']['s3_upload_urls']['rapid' + fileExt]
-    id        = uploadURLs['id']
+    url_model     = uploadURLs['links']['s3_upload_urls']['rapid' + fileExt]
+    multipartURLs = getMultipartURLs(uploadURLs, fileExt)
 
-    # upload binary data via PUT
-    print("Uploading model file ...")
-    req = urllib.request.Request(url_model, data=dataModel.read(), method='PUT')
-    response, code = executeServerRequest(req)
+    if uploadState and uploadState.uploaded:
+        print("Model file has already been uploaded by an earlier run.")
+    elif multipartURLs:
+        # upload parts of the file in parallel, if the server provided URLs for that
+        if not uploadMultipart(modelFile, multipartURLs, multipartParallelism, uploadState):
+            return False
+    else:
+        # upload binary data via PUT, streamed from disk
+        print("Uploading model file ...")
+        req = urllib.request.Request(url_model, data=dataModel, headers={'Content-Length' : str(dataModel.length)}, method='PUT')
+        response, code = executeServerRequest(req)
+
+        if response == None:
+            print("Could not upload model file.")
+            if uploadState:
+                # a single request can't be resumed, the upload has to start over
+                uploadState.remove()
+            return False
 
-    if response == None:
-        print("Could not upload model file.")
-        return False
+    if uploadState and not uploadState.uploaded:
+        uploadState.markUploaded()
+
+    return True
+
+# #############################################################################
+
+def finalizeRawModel(id, accessToken, baseUrl, uploadState=None):
+    if uploadState and uploadState.finalized:
+        return True
 
-    # finalize model upload
     reqHeaders = {'Authorization' : 'Bearer ' + accessToken,
                   'Content-Type' : 'application/json'}
 
@@ -153,41 +1805,55 @@ def uploadRawModel(modelFile, fileExt, uploadURLs, accessToken, baseUrl):
 
     if response == None:
         print("Could not upload model file.")
+        if uploadState and code is not None and 400 <= code < 500 and code not in (408, 429):
+            # e.g. the raw model is gone - the upload can't be continued
+            uploadState.remove()
         return False
 
-    upload_status = ""
-    checkOptStatusURL = baseUrl+BASE_ASSET_ENDPOINT.replace("{id}", str(id))
+    if uploadState:
+        uploadState.markFinalized()
+    return True
+
+# #############################################################################
+
+def waitForRawModel(id, fileExt, accessToken, baseUrl):
     # if this is a zip file, make sure that the server processed the file (unzipped)
-    if fileExt == ".zip":
+    unzipping = [fileExt == ".zip"]
+    if unzipping[0]:
         print("Waiting for the server to unzip the model.")
-        upload_status = "unzipping"
+    else:
+        print("Waiting for the server to analyse the model.")
 
-        while upload_status == "unzipping":
-            req = urllib.request.Request(checkOptStatusURL, headers=reqHeaders)
-            rJSON, code = getServerRequestJSON(req)
+    def check(rJSON):
+        upload_status = rJSON["data"]["upload_status"]
+        if unzipping[0] and upload_status != "unzipping":
+            unzipping[0] = False
+            print("Waiting for the server to analyse the model.")
+        return upload_status == "complete"
 
-            if rJSON == None:
-                print("Could not get the base asset status.")
-                return False
+    # wait for the model to be ready
+    checkOptStatusURL = baseUrl+BASE_ASSET_ENDPOINT.replace("{id}", str(id))
+    rJSON = statusPoller.watch("rawmodel", id, checkOptStatusURL, accessToken, check).result()
 
-            upload_status = rJSON["data"]["upload_status"]
-            time.sleep(1)
+    if rJSON == None:
+        print("Could not get the base asset status.")
+        return False
 
-    # wait for the model to be ready
-    print("Waiting for the server to analyse the model.")
-    while upload_status != "complete":
+    return True
 
-        req = urllib.request.Request(checkOptStatusURL, headers=reqHeaders)
-        rJSON, code = getServerRequestJSON(req)
+# #############################################################################
 
-        if rJSON == None:
-            print("Could not get the base asset status.")
-            return False
+def uploadRawModel(modelFile, fileExt, uploadURLs, accessToken, baseUrl, uploadState=None):
+    id = uploadURLs['id']
 
-        upload_status = rJSON["data"]["upload_status"]
-        time.sleep(1)
+    if not uploadModelData(modelFile, fileExt, uploadURLs, uploadState):
+        return False
+
+    # finalize model upload
+    if not finalizeRawModel(id, accessToken, baseUrl, uploadState):
+        return False
 
-    return True
+    return waitForRawModel(id, fileExt, accessToken, baseUrl)
 
 # #############################################################################
 
@@ -246,8 +1912,85 @@ def makeProgessBarStr(progress):
 
 # #############################################################################
 
-def generateOptimizedVariant(modelID, outputModelFilePrefix, variant, accessToken, baseUrl):
-    rawModelIDStr = str(modelID)
+def mergeVariants(variants):
+    # variants which only differ in their exports (or not at all, apart from their name) are optimized
+    # together, as one job with all of their exports - returns the jobs as (name, variant), named after
+    # their first variant, and for each job its variants, with the indices of their exports in the job
+    groups = collections.OrderedDict()
+    for variantName, variant in variants:
+        withoutExports = copy.deepcopy(variant)
+        exports        = withoutExports["config"]["compressionAndExport"].pop("fileExports")
+        groups.setdefault(canonicalJSONHash(withoutExports), []).append((variantName, variant, exports))
+
+    jobs    = []
+    members = {}
+    for group in groups.values():
+        jobName, jobVariant, jobExports = group[0]
+        jobVariant   = copy.deepcopy(jobVariant)
+        exports      = jobVariant["config"]["compressionAndExport"]["fileExports"] = []
+        exportHashes = []
+        members[jobName] = []
+        for variantName, variant, variantExports in group:
+            exportIndices = []
+            for export in variantExports:
+                exportHash = canonicalJSONHash(export)
+                if exportHash not in exportHashes:
+                    exportHashes.append(exportHash)
+                    exports.append(export)
+                exportIndices.append(exportHashes.index(exportHash))
+            members[jobName].append((variantName, exportIndices))
+        jobs.append((jobName, jobVariant))
+
+        if len(group) > 1:
+            print("Variants " + ", ".join("\"" + variantName + "\"" for variantName, exportIndices in members[jobName]) +
+                  " only differ in their exports, they are optimized together as \"" + jobName + "\" with " + str(len(exports)) + " exports.")
+    return jobs, members
+
+# #############################################################################
+
+def downloadVariantResults(rJSON, variant, outputs):
+    # outputs: output file prefix, indices of its exports in the variant and result cache key of
+    # each variant produced by this optimization
+    exports      = variant["config"]["compressionAndExport"]["fileExports"]
+    downloadURLs = list(rJSON["data"]["downloads"]["all"].values())
+
+    # name and download results
+    # using "downloads"->"all" is the most straightforward way,
+    # since each entry there corresponds to one entry in "fileExports"
+    # if you need to rename and differentiate between file formats,
+    # there are also individual lists / values for each file extension
+    downloadedFiles = {}    # export index -> downloaded file, copied for the other variants with this export
+    success         = True
+    for outputModelFilePrefix, exportIndices, resultKey in outputs:
+        filenameSuffixes = []
+        for i, exportIndex in enumerate(exportIndices):
+            fileType = exports[exportIndex]["fileType"]
+
+            fileExt  = fileType
+            if (fileType == "obj" or fileType == "gltf"):
+                fileExt = ".zip"
+
+            filenameSuffix = "_e" + str(i) + "." + fileExt
+            if exportIndex in downloadedFiles:
+                method = copyOutputFile(downloadedFiles[exportIndex], outputModelFilePrefix + filenameSuffix)
+                print("Stored \"" + downloadedFiles[exportIndex] + "\" as \"" + outputModelFilePrefix + filenameSuffix + "\" (" + method + ").")
+            elif downloadFile(downloadURLs[exportIndex], outputModelFilePrefix + filenameSuffix):
+                downloadedFiles[exportIndex] = outputModelFilePrefix + filenameSuffix
+            else:
+                success = False
+                continue
+            filenameSuffixes.append(filenameSuffix)
+
+        # only complete results go into the result cache
+        if len(filenameSuffixes) == len(exportIndices) and resultKey is not None and resultCache is not None:
+            resultCache.store(resultKey, outputModelFilePrefix, filenameSuffixes)
+
+    return success
+
+# #############################################################################
+
+def submitOptimization(modelID, variant, accessToken, baseUrl, jobLabel=None):
+    label = jobLabel if jobLabel is not None else ""
 
     reqHeaders = {'Authorization' : 'Bearer ' + accessToken,
                   'Content-Type' : 'application/json'}
@@ -257,39 +2000,39 @@ def generateOptimizedVariant(modelID, outputModelFilePrefix, variant, accessToke
 
     data = json.dumps(payload).encode("utf8")
 
-    print("Submitting optimization job ...")
-    optimizedModelURL= baseUrl+OPTIMIZE_MODEL_ENDPOINT.replace("{id}", rawModelIDStr)
+    print(label + "Submitting optimization job ...")
+    optimizedModelURL= baseUrl+OPTIMIZE_MODEL_ENDPOINT.replace("{id}", str(modelID))
     req         = urllib.request.Request(optimizedModelURL, data=data, headers=reqHeaders)
     rJSON, code = getServerRequestJSON(req)
 
     if rJSON == None:
-        print("Could not submit optimization job.")
+        print(label + "Could not submit optimization job.")
         return -1
 
-    rapidModelID    = rJSON["id"]
-    rapidModelIDStr = str(rapidModelID)
-
-    # check model status
-    print("Waiting for optimization to complete for rapid model " + rapidModelIDStr)
-
-    opt_status = "sent_to_queue"
+    return rJSON["id"]
 
-    checkOptStatusURL = baseUrl+RAPID_MODEL_ENDPOINT.replace("{id}", rapidModelIDStr)
-    while (opt_status != "done"):
-        req         = urllib.request.Request(checkOptStatusURL, headers=reqHeaders)
-        rJSON, code = getServerRequestJSON(req)
+# #############################################################################
 
-        # too many requests?
-        if code == 429:
-            print("Retrying in 30 seconds...")
-            time.sleep(30)
-            continue
+def waitForOptimization(rapidModelID, accessToken, baseUrl, jobLabel=None):
+    rapidModelIDStr = str(rapidModelID)
 
-        if rJSON == None:
-            print("Could not get the optimization status.")
-            return -1
+    # with a job label (i.e. when several jobs run at once), messages are prefixed with it
+    # and progress is reported line by line instead of with a progress bar
+    label = jobLabel if jobLabel is not None else ""
 
-        if "data" in rJSON and "progress" in rJSON["data"]:
+    # check model status
+    print(label + "Waiting for optimization to complete for rapid model " + rapidModelIDStr)
+
+    lastProgress  = [None]
+    unexpectedRun = [False]
+
+    def check(rJSON):
+        if "data" in rJSON and "progress" in rJSON["data"] and jobLabel is not None:
+            progress = (rJSON["data"]["progress"], rJSON["data"]["processing_step"])
+            if progress != lastProgress[0]:
+                print(label + "Progress: " + str(progress[0]) + "%" + ("  |  " + progress[1] if progress[1] else ""))
+                lastProgress[0] = progress
+        elif "data" in rJSON and "progress" in rJSON["data"]:
             progress   = rJSON["data"]["progress"]
             barDisplay = makeProgessBarStr(progress)
             for i in range(3-len(str(progress))):
@@ -303,63 +2046,161 @@ def generateOptimizedVariant(modelID, outputModelFilePrefix, variant, accessToke
 
         opt_status = rJSON["data"]["optimization_status"]
         if (opt_status != "sent_to_queue" and opt_status != "done"):
-            print("Error: Unexpected status code from optimization run (" + opt_status + ").")
-            return -1
+            print(label + "Error: Unexpected status code from optimization run (" + opt_status + ").")
+            unexpectedRun[0] = True
+            return None
+        return opt_status == "done"
 
-        time.sleep(2)
+    checkOptStatusURL = baseUrl+RAPID_MODEL_ENDPOINT.replace("{id}", rapidModelIDStr)
+    rJSON = statusPoller.watch("rapidmodel", rapidModelID, checkOptStatusURL, accessToken, check).result()
+
+    if rJSON == None:
+        if not unexpectedRun[0]:
+            print(label + "Could not get the optimization status.")
+        return None
 
     # optimization successful
 
-    barDisplayFinal = makeProgessBarStr(100)
-    print(f"\rProgress: {barDisplayFinal} 100%  |  Finished.                               \n", end = '')
+    if jobLabel is not None:
+        print(label + "Finished, downloading results ...")
+    else:
+        barDisplayFinal = makeProgessBarStr(100)
+        print(f"\rProgress: {barDisplayFinal} 100%  |  Finished.                               \n", end = '')
 
-    exports      = variant["config"]["compressionAndExport"]["fileExports"]
-    downloadURLs = rJSON["data"]["downloads"]["all"]
+    return rJSON
 
-    # name and download results
-    # using "downloads"->"all" is the most straightforward way,
-    # since each entry there corresponds to one entry in "fileExports"
-    # if you need to rename and differentiate between file formats,
-    # there are also individual lists / values for each file extension
-    i = 0
-    for key in downloadURLs:
-        dlURL    = downloadURLs[key]
-        fileType = exports[i]["fileType"]
+# #############################################################################
 
-        fileExt  = fileType
-        if (fileType == "obj" or fileType == "gltf"):
-            fileExt = ".zip"
+def generateOptimizedVariant(modelID, outputs, variant, accessToken, baseUrl, jobLabel=None, journalEntry=None, runningRapidModelID=None):
+    # outputs: variants produced by this optimization, see downloadVariantResults
+    # journalEntry: (file key, variant key, keys of the produced variants) under which the progress is recorded in the journal
+    # runningRapidModelID: rapid model submitted by an earlier run, whose results are still missing
+    rJSON = None
+    if runningRapidModelID is not None:
+        print((jobLabel or "") + "Continuing with rapid model " + str(runningRapidModelID) + " from an earlier run.")
+        rapidModelID = runningRapidModelID
+        rJSON        = waitForOptimization(rapidModelID, accessToken, baseUrl, jobLabel)
+
+    # submit the optimization, unless an earlier run has already done that (successfully)
+    if rJSON == None:
+        rapidModelID = submitOptimization(modelID, variant, accessToken, baseUrl, jobLabel)
+        if rapidModelID == -1:
+            if journalEntry:
+                journal.record(journalEntry[0], journalEntry[1], "failed")
+            return -1
+        if journalEntry:
+            journal.record(journalEntry[0], journalEntry[1], "submitted", rapidModelID)
 
-        filenameSuffix = "_e" + str(i) + "." + fileExt
-        downloadFile(dlURL, outputModelFilePrefix + filenameSuffix)
+        rJSON = waitForOptimization(rapidModelID, accessToken, baseUrl, jobLabel)
+        if rJSON == None:
+            if journalEntry:
+                journal.record(journalEntry[0], journalEntry[1], "failed", rapidModelID)
+            return -1
 
-        i += 1
+    # failed downloads leave the variant "submitted", so that --resume only downloads the results again
+    if downloadVariantResults(rJSON, variant, outputs) and journalEntry:
+        for variantKey in journalEntry[2]:
+            journal.record(journalEntry[0], variantKey, "downloaded", rapidModelID)
 
     return rapidModelID
 
 # #############################################################################
 
-def validateJSONWithAPISchema(variantConfig, schemaFile, silent):
-    schema = None
-    try:
+# validators are built once per schema file (as long as it isn't modified), and the result for
+# each distinct variant configuration is remembered, together with the validation report -
+# in memory, and in <cacheDir>/validation/ for later runs
+schemaHashes      = {}    # (path, mtime, size) -> schema hash
+schemaValidators  = {}    # schema hash -> validator
+validationResults = {}    # (schema hash, variant config hash) -> (valid, report)
+validationLock    = threading.Lock()
+
+def getSchemaHash(schemaFile):
+    fileStat = os.stat(schemaFile)
+    key      = (os.path.abspath(schemaFile), fileStat.st_mtime_ns, fileStat.st_size)
+    if key not in schemaHashes:
+        with open(schemaFile, 'rb') as f:
+            schemaHashes[key] = hashlib.sha256(f.read()).hexdigest()
+    return schemaHashes[key]
+
+def getSchemaValidator(schemaFile, schemaHash):
+    if schemaHash not in schemaValidators:
+        import jsonschema
         with open(schemaFile) as f:
             schema = json.load(f)
-    except:
-        if (silent == False):
-            print("Error: Unable to validate configuration against schema: schema couldn't be read from file \"" + schemaFile + "\".")
-        return False
+        # like jsonschema.validate, fall back to the latest draft for unknown $schema versions (quietly)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            validatorClass = jsonschema.validators.validator_for(schema)
+        validatorClass.check_schema(schema)
+        schemaValidators[schemaHash] = validatorClass(schema)
+    return schemaValidators[schemaHash]
 
-    try:
-        jsonschema.validate(variantConfig, schema)
+def canonicalJSONHash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+def validationResultPath(key):
+    return os.path.join(cacheDir, "validation", key[0], key[1] + ".json")
+
+# #############################################################################
+
+def validateJSONWithAPISchema(variantConfig, schemaFile, silent):
+    # validators aren't thread-safe (they keep track of the $ref scope), so validation is serialized
+    with validationLock:
+        try:
+            key = (getSchemaHash(schemaFile), canonicalJSONHash(variantConfig))
+        except OSError:
+            key = None
+
+        result = validationResults.get(key) if key is not None else None
+        if result is None and key is not None and validationCacheEnabled:
+            try:
+                with open(validationResultPath(key)) as f:
+                    resultJSON = json.load(f)
+                result = (resultJSON["valid"], resultJSON["report"])
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        if result is None:
+            try:
+                validator = getSchemaValidator(schemaFile, key[0]) if key is not None else None
+            except (OSError, ValueError):
+                validator = None
+            except Exception as e:
+                # the schema itself is invalid
+                validator = e
+
+            if validator is None:
+                if (silent == False):
+                    print("Error: Unable to validate configuration against schema: schema couldn't be read from file \"" + schemaFile + "\".")
+                return False
+
+            if isinstance(validator, Exception):
+                result = (False, str(validator))
+            else:
+                import jsonschema
+                error  = jsonschema.exceptions.best_match(validator.iter_errors(variantConfig))
+                result = (error is None, str(error) if error is not None else None)
+
+            if validationCacheEnabled:
+                try:
+                    os.makedirs(os.path.dirname(validationResultPath(key)), exist_ok=True)
+                    writeJSONAtomically(validationResultPath(key), {"valid": result[0], "report": result[1]})
+                except OSError:
+                    pass
+
+        validationResults[key] = result
+
+    valid, report = result
+    if valid:
         if (silent == False):
             print("Variant configuration passed validation.")
         return True
-    except Exception as e:
-        if (silent == False):
-            print("Error: Variant configuration is not valid - see JSON validation report on how to fix this:")
-            print("********************************************************************************")
-            print(e)
-            print("********************************************************************************")
+
+    if (silent == False):
+        print("Error: Variant configuration is not valid - see JSON validation report on how to fix this:")
+        print("********************************************************************************")
+        print(report)
+        print("********************************************************************************")
 
     return False
 
@@ -379,182 +2220,1159 @@ def validateJSONConfigContent(variantConfig):
 
 
 # ################################ #
-#           Main Program           #
+#       Processing Input Files     #
 # ################################ #
 
-# argument parsing
+class ModelFileError(Exception):
+    """Processing of an input file had to be stopped."""
 
-parser = ArgumentParser()
+# #############################################################################
 
-parser.add_argument("model",                    help="input directory or 3D model (must be a .glb file OR .zip file OR base asset ID in the form <number>.id)")
-parser.add_argument("-b", "--base-url", dest="baseUrl", default="https://api.rapidcompact.com/api/v2/", help="api base url")
-parser.add_argument("-c", "--credentials-file", dest="credentialsFile", default="credentials.json", help="credentials JSON file")
-parser.add_argument("-v", "--variants-file", dest="variantsFile", default="variants.json", help="variant definitions JSON file")
-parser.add_argument("-s", "--settings-file", dest="settingsFile", default="settings.json", help="settings JSON file")
-parser.add_argument("-l", "--label",  dest="modelLabel", default="", help="label for the model")
-parser.add_argument("-o", "--origin", dest="originDesc", default="Gallery Uploader Script", help="origin label for the model")
-parser.add_argument('--cleanup',    dest='cleanup', action='store_true')
-parser.add_argument('--no-cleanup', dest='cleanup', action='store_false')
-parser.add_argument("-e", "--exit", dest="exitOnError", default=False, help="exit script on optimize error. Set False or True")
+class ModelFileJob:
+    """State of one input file while it is processed.
+
+    All modes take the same steps for an input file - planModelFile, prepareBaseAsset,
+    uploadBaseAsset and cleanupModelFile - and only differ in how they schedule them and
+    produce the variants: one file after the other (processModelFile), in pipeline stages,
+    or with the asyncio engine.
+    """
+
+    def __init__(self, modelFile):
+        self.modelFile           = modelFile
+        self.name                = os.path.basename(modelFile[0:modelFile.rfind('.')])
+        self.label               = "[" + os.path.basename(modelFile) + "] "
+        self.fileExt             = pathlib.Path(modelFile).suffix
+        self.isBaseAssetID       = modelFile.endswith(".id")
+        self.modelID             = modelFile[:-3] if self.isBaseAssetID else None
+        self.uploadURLs          = None    # only set if the model file has to be uploaded
+        self.uploadState         = None
+        self.resumedUpload       = False
+        self.sha256              = None
+        self.variants            = []
+        self.members             = {}
+        self.jobKeys             = {}
+        self.resultKeys          = {}
+        self.journalKey          = None
+        self.journalKeys         = {}
+        self.journalState        = JournalState()
+        self.rapidModelIDs       = {}
+        self.resumedRapidModels  = set()
+        self.leftoverRapidModels = []
+        self.results             = {}
+        self.failedVariants      = set()
+        self.error               = None
+
+    def outputPrefix(self, variantName):
+        return "output/" + self.name + "_" + variantName
+
+    def outputsOf(self, variantName):
+        # the optimization produces the results of all variants merged into this one, see downloadVariantResults
+        return [(self.outputPrefix(memberName), exportIndices, self.resultKeys.get(memberName)) for memberName, exportIndices in self.members[variantName]]
+
+    def journalEntryOf(self, variantName):
+        # see generateOptimizedVariant
+        return (self.journalKey, self.jobKeys[variantName], [self.journalKeys[memberName] for memberName, exportIndices in self.members[variantName]])
+
+    def fail(self, error):
+        print(error)
+        self.error = error
+        # none of the variants which are still pending will be produced
+        for variantName, variant in self.variants:
+            if variantName not in self.results:
+                self.failedVariants.add(variantName)
+        return False
 
-parser.set_defaults(cleanup=True)
+    def failedOptimizations(self):
+        # only variants which couldn't be produced count as failed - all variants optimized together
+        # fail together (before merging, each variant stands for itself)
+        return sum(len(self.members.get(variantName, [variantName])) for variantName in self.failedVariants)
 
-pArgs     = parser.parse_args()
-argsDict = vars(pArgs)
+# #############################################################################
 
-modelFile       = argsDict["model"]
-variantsFile    = argsDict["variantsFile"]
-credentialsFile = argsDict["credentialsFile"]
-settings_file   = argsDict["settingsFile"]
-modelLabel      = argsDict["modelLabel"]
-originDesc      = argsDict["originDesc"]
-baseUrl         = argsDict["baseUrl"]
-cleanup         = argsDict["cleanup"]
-exitOnError     = argsDict["exitOnError"]
+def getValidVariants(silent):
+    variants = []
+    for variantName in userVariants["variants"]:
+        variant = userVariants["variants"][variantName]
+        if (silent == False):
+            print("Validating configuration for variant \"" + variantName + "\".")
+        if (validateJSONWithAPISchema(variant["config"], SchemaJSONPath, silent) and validateJSONConfigContent(variant["config"])):
+            variants.append((variantName, variant))
+    return variants
 
+# #############################################################################
 
-print("API Endpoint: "+baseUrl)
+def planModelFile(job, variants):
+    # determines which of the (valid) variants still have to be produced - returns False if none
+    job.variants = list(variants)
 
-userCredentials = None
-userVariants    = None
-settings        = None
+    # check if output folder exists (other jobs may create it at the same time)
+    os.makedirs("output", exist_ok=True)
 
-try:
-    with open(credentialsFile) as f:
-        userCredentials = json.load(f)
-except:
-    print("Unable to load and parse credentials JSON file \"" + credentialsFile + "\". Make sure the file exists and is valid JSON.")
-    sys.exit(1)
+    # the model file is identified by its content, size and modification time below
+    if not job.isBaseAssetID and not os.path.isfile(job.modelFile):
+        raise ModelFileError("Error: cannot open model file \"" + job.modelFile + "\"")
+    job.journalKey = Journal.fileKey(job.modelFile)
 
-try:
-    with open(variantsFile) as f:
-        userVariants = json.load(f)
-except:
-    print("Unable to load and parse variant definitions JSON file \"" + variantsFile + "\". Make sure the file exists and is valid JSON.")
-    sys.exit(1)
+    # results of earlier runs for the same model and variant are taken from the result cache,
+    # if that covers all variants, the model doesn't need to be uploaded at all
+    if resultCache is not None:
+        job.variants, job.resultKeys = restoreCachedResults(job.modelFile, job.variants, job.outputPrefix)
+        if not job.variants:
+            return False
 
-try:
-    with open(settings_file) as f:
-        settings = json.load(f)
-except(OSError, json.JSONDecodeError):
-    print("Unable to load and parse settings JSON file \"" + settings_file + "\". Make sure the file exists and is valid JSON.")
-    sys.exit(1)
+    # the journal records the progress on this file, with --resume the progress of earlier runs is used
+    job.journalKeys = {variantName: Journal.variantKey(variantName, variant) for variantName, variant in job.variants}
+    if resume:
+        job.journalState = journal.stateOf(job.journalKey)
+    job.variants, job.leftoverRapidModels = skipFinishedVariants(job.journalState, job.journalKeys, job.variants)
+    job.variants, job.members             = mergeVariants(job.variants)
+    job.jobKeys                           = {variantName: Journal.variantKey(variantName, variant) for variantName, variant in job.variants}
+    if not job.variants and not job.isBaseAssetID:
+        # all variants are done, only the cleanup of an earlier run may be missing
+        job.modelID = job.journalState.rawModelID
+    return len(job.variants) > 0
+
+# #############################################################################
+
+def prepareBaseAsset(job):
+    # uses a base asset with the same content from an earlier run, or the base asset uploaded by an
+    # earlier run - otherwise the model file has to be uploaded, and job.uploadURLs is set
+    if job.isBaseAssetID:
+        return
+
+    if baseAssetCache is not None:
+        job.sha256, job.modelID = findCachedBaseAsset(job.modelFile, accessToken, baseUrl)
+        if job.modelID is not None:
+            journal.record(job.journalKey, "", "uploaded", job.modelID)
+            return
+
+    if job.journalState.rawModelID is not None and checkBaseAsset(job.journalState.rawModelID, accessToken, baseUrl)[0]:
+        print("Continuing with base asset " + job.journalState.rawModelID + " uploaded by an earlier run.")
+        job.modelID = job.journalState.rawModelID
+        return
+
+    # obtain signed URLs for upload, or continue an interrupted upload of an earlier run
+    job.uploadState = UploadState.load(job.modelFile)
+    if (job.uploadState is not None):
+        print("Resuming interrupted upload of base asset " + str(job.uploadState.uploadURLs['id']) + ".")
+        job.uploadURLs    = job.uploadState.uploadURLs
+        job.modelID       = job.uploadURLs['id']
+        job.resumedUpload = True
+    else:
+        requestUploadURLs(job)
+
+def requestUploadURLs(job):
+    job.uploadURLs = getUploadURLs(job.fileExt, accessToken, modelLabel if modelLabel != "" else job.name, baseUrl, getMultipartPartCount(job.modelFile))
+    if (job.uploadURLs is None):
+        raise ModelFileError("Couldn't obtain signed upload URLs from server.")
+    job.uploadState = UploadState.create(job.modelFile, job.uploadURLs) if getMultipartURLs(job.uploadURLs, job.fileExt) else None
+    job.modelID     = job.uploadURLs['id']
+
+# #############################################################################
+
+def uploadBaseAsset(job):
+    # uploads the model file into the "Base Assets" section - the server analyses it afterwards,
+    # see waitForRawModel and finishBaseAssetUpload
+    while not (uploadModelData(job.modelFile, job.fileExt, job.uploadURLs, job.uploadState) and finalizeRawModel(job.modelID, accessToken, baseUrl, job.uploadState)):
+        # if the upload of an earlier run can't be continued (e.g. because its upload URLs have expired), start over
+        if not (job.resumedUpload and job.uploadState.removed):
+            raise ModelFileError("Couldn't upload base asset.")
+        print("The upload of the earlier run can't be continued, starting a new upload.")
+        job.resumedUpload = False
+        requestUploadURLs(job)
+
+    if job.uploadState is not None:
+        job.uploadState.remove()
+
+def finishBaseAssetUpload(job):
+    if baseAssetCache is not None:
+        baseAssetCache.store(job.sha256, job.modelID)
+    journal.record(job.journalKey, "", "uploaded", job.modelID)
+
+# #############################################################################
+
+def cleanupModelFile(job):
+    # where desired, delete the base asset and the optimized results from the cloud storage
+    rapidModelIDs = list(job.rapidModelIDs.values()) + job.leftoverRapidModels
+    if (job.isBaseAssetID or not cleanup or (job.modelID is None and not rapidModelIDs)):
+        return
+
+    # base assets in the base asset cache are kept, to be used by later runs - and so are base assets
+    # whose upload failed, but can still be continued by the next run (it would fail on a deleted one)
+    uploadPending = job.uploadState is not None and not job.uploadState.removed
+    if baseAssetCache is None and not uploadPending:
+        print("Cleaning up: deleting uploaded base asset and optimized results. If you want to skip this step, run again with option --no-cleanup.")
+        if job.modelID is not None:
+            deleteBaseAsset(job.modelID, accessToken)
+    else:
+        print("Cleaning up: deleting optimized results, keeping the base asset for later runs. If you want to skip this step, run again with option --no-cleanup.")
+    for rapidModelID in rapidModelIDs:
+        deleteRapidModel(rapidModelID, accessToken)
+    journal.record(job.journalKey, "", "cleaned")
+
+# #############################################################################
+
+def reportFailedFiles(modelFileJobs):
+    # returns the number of input files which couldn't be processed
+    failedJobs = [job for job in modelFileJobs if job.error is not None]
+    if failedJobs:
+        print(str(len(failedJobs)) + " of " + str(len(modelFileJobs)) + " input files could not be processed:")
+        for job in failedJobs:
+            print("  " + job.modelFile + ": " + job.error)
+    return len(failedJobs)
+
+# #############################################################################
+
+def processModelFile(job):
+    if (accessToken == ""):
+        raise ModelFileError("Couldn't log in. Are your credentials valid?")
+
+    # validate before uploading, to prevent unnecessary waiting and traffic
+    variants = getValidVariants(job.isBaseAssetID)
+    if not variants:
+        raise ModelFileError("No valid variant configuration found. Terminating.")
+
+    try:
+        if planModelFile(job, variants):
+            # 2) use a base asset with the same content from an earlier run, obtain signed URLs for
+            #    upload, or continue an interrupted upload of an earlier run
+            prepareBaseAsset(job)
+
+            # 3) upload model into the "Base Assets" section, or take existing ID
+            if job.uploadURLs is not None:
+                uploadBaseAsset(job)
+                if not waitForRawModel(job.modelID, job.fileExt, accessToken, baseUrl):
+                    raise ModelFileError("Couldn't upload base asset.")
+                finishBaseAssetUpload(job)
+
+            # 4) create optimized variants
+            produceVariants(job)
+    except concurrent.futures.CancelledError:
+        # the run has been interrupted, what is on the server is left as it is for --resume
+        raise
+    except Exception:
+        # like in pipeline mode, what has been created on the server so far is deleted nevertheless
+        cleanupModelFile(job)
+        raise
+
+    # 5) where desired, delete the base asset from the cloud storage after optimization
+    cleanupModelFile(job)
+
+# #############################################################################
+
+def produceVariants(job):
+    # all valid variants are submitted right away, so that the server can optimize them in parallel
+
+    def produceVariant(variantName, variant):
+        # with several jobs, the output is already labelled with the input file - variants produced
+        # at once are labelled the same way, so that their lines don't get mixed up (see JobOutput)
+        if currentJobLabel.get():
+            jobLabel = "[" + variantName + "] "
+        elif variantConcurrency > 1:
+            currentJobLabel.set("[" + job.name + "_" + variantName + "] ")
+            jobLabel = ""
+        else:
+            jobLabel = None
+
+        print("Producing asset variant \"" + variantName + "\".")
+        return generateOptimizedVariant(job.modelID, job.outputsOf(variantName), variant, accessToken, baseUrl, jobLabel,
+                                        job.journalEntryOf(variantName), job.journalState.runningRapidModelID(job.jobKeys[variantName]))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=variantConcurrency) as executor:
+        results = collectResults([submitInJobContext(executor, produceVariant, variantName, variant) for variantName, variant in job.variants])
+
+    for (variantName, variant), resultRapidModelID in zip(job.variants, results):
+        if (resultRapidModelID != -1):
+            job.rapidModelIDs[variantName] = resultRapidModelID
+        else:
+            job.failedVariants.add(variantName)
+
+# #############################################################################
+
+def processModelFileJob(job):
+    # runs in a worker thread: the output is labelled with the input file, and errors are
+    # recorded instead of ending the run
+    currentJobLabel.set(job.label)
+    try:
+        processModelFile(job)
+    except ModelFileError as e:
+        job.fail(str(e))
+    except concurrent.futures.CancelledError:
+        # the run has been interrupted, this is not an error of the file
+        raise
+    except Exception as e:
+        # e.g. an unexpected response from the server - the other files are still processed
+        job.fail("Error: Processing failed (" + repr(e) + ").")
+    return job
+
+# #############################################################################
+
+def processModelFiles(filesToProcess, jobs):
+    print("Processing up to " + str(jobs) + " input files at once.")
+    sys.stdout = JobOutput(sys.stdout)
+
+    modelFileJobs = [ModelFileJob(nextModelFile) for nextModelFile in filesToProcess]
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            collectResults([submitInJobContext(executor, processModelFileJob, job) for job in modelFileJobs])
+    finally:
+        sys.stdout = sys.stdout.stream
+
+    return modelFileJobs
+
+
+# ################################ #
+#        Pipelined Processing      #
+# ################################ #
 
-# Load Settings
-SchemaJSONPath = settings["schemaPath"]
+def validateStage(job):
+    variants = getValidVariants(True)
+    if not variants:
+        return job.fail("No valid variant configuration found, skipping this file.")
+    # results of earlier runs are taken from the result cache and (with --resume) variants finished
+    # by an earlier run are skipped, the other stages are skipped if that covers all variants
+    return planModelFile(job, variants)
 
-# For ExitOnError Flag
-failedOptimizations = 0
+def uploadURLsStage(job):
+    prepareBaseAsset(job)
+    return True
+
+def uploadStage(job):
+    if job.uploadURLs is not None:
+        uploadBaseAsset(job)
+    return True
+
+def analyseWaitStage(job):
+    if job.uploadURLs is None:
+        return True
+    if not waitForRawModel(job.modelID, job.fileExt, accessToken, baseUrl):
+        return job.fail("Couldn't upload base asset.")
+    finishBaseAssetUpload(job)
+    return True
+
+def submitVariant(job, variantName, variant):
+    rapidModelID = submitOptimization(job.modelID, variant, accessToken, baseUrl, "[" + variantName + "] ")
+    if rapidModelID == -1:
+        job.failedVariants.add(variantName)
+        journal.record(job.journalKey, job.jobKeys[variantName], "failed")
+    else:
+        job.rapidModelIDs[variantName] = rapidModelID
+        journal.record(job.journalKey, job.jobKeys[variantName], "submitted", rapidModelID)
+
+def submitStage(job):
+    # all variants are submitted at once, so that the server can optimize them in parallel -
+    # unless an earlier run has already done that
+    for variantName, variant in job.variants:
+        rapidModelID = job.journalState.runningRapidModelID(job.jobKeys[variantName])
+        if rapidModelID is not None:
+            print("[" + variantName + "] Continuing with rapid model " + rapidModelID + " from an earlier run.")
+            job.rapidModelIDs[variantName] = rapidModelID
+            job.resumedRapidModels.add(variantName)
+        else:
+            submitVariant(job, variantName, variant)
+    return len(job.rapidModelIDs) > 0
+
+def pollStage(job):
+    for variantName, variant in job.variants:
+        if variantName in job.rapidModelIDs:
+            rJSON = waitForOptimization(job.rapidModelIDs[variantName], accessToken, baseUrl, "[" + variantName + "] ")
+            if rJSON == None and variantName in job.resumedRapidModels:
+                # the rapid model of the earlier run is gone or broken, optimize again
+                del job.rapidModelIDs[variantName]
+                submitVariant(job, variantName, variant)
+                if variantName in job.rapidModelIDs:
+                    rJSON = waitForOptimization(job.rapidModelIDs[variantName], accessToken, baseUrl, "[" + variantName + "] ")
+            if rJSON == None:
+                if variantName not in job.failedVariants:
+                    job.failedVariants.add(variantName)
+                    journal.record(job.journalKey, job.jobKeys[variantName], "failed", job.rapidModelIDs.get(variantName))
+            else:
+                job.results[variantName] = rJSON
+    return len(job.results) > 0
+
+def downloadStage(job):
+    for variantName, variant in job.variants:
+        if variantName in job.results:
+            if downloadVariantResults(job.results[variantName], variant, job.outputsOf(variantName)):
+                for memberName, exportIndices in job.members[variantName]:
+                    journal.record(job.journalKey, job.journalKeys[memberName], "downloaded", job.rapidModelIDs[variantName])
+    return True
+
+def cleanupStage(job):
+    cleanupModelFile(job)
+    return True
 
-# 1) obtain token from credentials file
+# stages with their default number of worker threads
+PIPELINE_STAGES = [("validate",   validateStage,    1),
+                   ("uploadURLs", uploadURLsStage,  1),
+                   ("upload",     uploadStage,      2),
+                   ("analyse",    analyseWaitStage, 4),
+                   ("submit",     submitStage,      1),
+                   ("poll",       pollStage,        8),
+                   ("download",   downloadStage,    2),
+                   ("cleanup",    cleanupStage,     1)]
 
-accessToken = userCredentials["token"]
+# #############################################################################
 
-# iterate over input directory OR use input file
-directoryMode = os.path.isdir(modelFile)
-filesToProcess =[]
+class PipelineStage:
+    """Worker threads taking jobs from a bounded input queue; keeps track of how busy they are."""
+
+    def __init__(self, name, fn, workers, queueSize):
+        self.name        = name
+        self.fn          = fn
+        self.workers     = max(1, workers)
+        self.queue       = queue.Queue(max(1, queueSize))
+        self.busy        = 0
+        self.busyTime    = 0.0
+        self.processed   = 0
+        self.depthSum    = 0
+        self.depthMax    = 0
+        self.depthCount  = 0
+        self.lock        = threading.Lock()
+
+    def sampleDepth(self):
+        depth = self.queue.qsize()
+        with self.lock:
+            self.depthSum   += depth
+            self.depthMax    = max(self.depthMax, depth)
+            self.depthCount += 1
+        return depth
+
+    def utilization(self, elapsed):
+        with self.lock:
+            busyTime = self.busyTime
+        return busyTime / (self.workers * elapsed) if elapsed > 0 else 0.0
 
-if directoryMode:
-    print("Running in directory mode.")
-    filesToProcess = os.listdir(modelFile)
-    # to streamline code below, add the path prefix, just like in single-file mode
-    for i in range(0, len(filesToProcess)):
-        filesToProcess[i] = os.path.join(modelFile, filesToProcess[i])
-else:
-    print("Running in single-file mode.")
-    filesToProcess = [modelFile]
+# #############################################################################
 
-for nextModelFile in filesToProcess:
+class Pipeline:
+    """Runs input files through PIPELINE_STAGES. The stages are joined by bounded queues, so that
+    e.g. one file can be uploaded while another one is optimized on the server and the results of
+    a third one are downloaded. Jobs failing in a stage skip ahead to the cleanup stage."""
+
+    def __init__(self, stageWorkers, queueSize, reportInterval):
+        self.stages         = [PipelineStage(name, fn, stageWorkers.get(name, workers), queueSize) for name, fn, workers in PIPELINE_STAGES]
+        self.reportInterval = reportInterval
+        self.finished       = []
+        self.finishedLock   = threading.Lock()
+        self.startTime      = None
+
+    def runWorker(self, stageIdx):
+        stage = self.stages[stageIdx]
+        while True:
+            job = stage.queue.get()
+            if job is None:
+                return
+
+            with stage.lock:
+                stage.busy += 1
+            startTime = time.monotonic()
+            token     = currentJobLabel.set(job.label)
+            try:
+                success = stage.fn(job)
+            except concurrent.futures.CancelledError:
+                # the run has been interrupted, the job is left as it is for --resume
+                return
+            except ModelFileError as e:
+                success = job.fail(str(e))
+            except Exception as e:
+                success = job.fail("Error in stage " + stage.name + ": " + repr(e))
+            finally:
+                currentJobLabel.reset(token)
+                with stage.lock:
+                    stage.busy      -= 1
+                    stage.busyTime  += time.monotonic() - startTime
+                    stage.processed += 1
+
+            if stageIdx == len(self.stages) - 1:
+                with self.finishedLock:
+                    self.finished.append(job)
+            elif success:
+                self.stages[stageIdx + 1].queue.put(job)
+            else:
+                self.stages[-1].queue.put(job)
+
+    def statusLine(self):
+        elapsed = time.monotonic() - self.startTime
+        parts   = []
+        for stage in self.stages:
+            parts.append(stage.name + " " + str(stage.busy) + "/" + str(stage.workers) + " q" + str(stage.sampleDepth()))
+        return "Pipeline after " + str(int(elapsed)) + "s: " + ", ".join(parts)
+
+    def run(self, filesToProcess):
+        self.startTime = time.monotonic()
+        threads        = []
+        for stageIdx, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self.runWorker, args=(stageIdx,), daemon=True)
+                thread.start()
+                threads.append((stageIdx, thread))
+
+        # the input queue is bounded too, so files are only picked up when the first stage has room
+        lastReport = self.startTime
+        for nextModelFile in filesToProcess:
+            while True:
+                try:
+                    self.stages[0].queue.put(ModelFileJob(nextModelFile), timeout=1)
+                    break
+                except queue.Full:
+                    lastReport = self.report(lastReport)
+
+        while True:
+            with self.finishedLock:
+                if len(self.finished) == len(filesToProcess):
+                    break
+            time.sleep(0.2)
+            lastReport = self.report(lastReport)
+
+        # stop the workers, stage by stage
+        for stageIdx, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                stage.queue.put(None)
+        for stageIdx, thread in threads:
+            thread.join()
+
+        return self.finished
+
+    def report(self, lastReport):
+        now = time.monotonic()
+        for stage in self.stages:
+            stage.sampleDepth()
+        if self.reportInterval > 0 and now - lastReport >= self.reportInterval:
+            print(self.statusLine())
+            return now
+        return lastReport
+
+    def summary(self):
+        elapsed = time.monotonic() - self.startTime
+        lines   = ["Pipeline statistics (" + "{:.1f}".format(elapsed) + "s):"]
+        for stage in self.stages:
+            avgDepth = stage.depthSum / stage.depthCount if stage.depthCount else 0.0
+            lines.append("  {:<10} {:>2} workers, {:>4} jobs, utilization {:>5.1f}%, queue depth avg {:.1f} / max {}".format(
+                stage.name, stage.workers, stage.processed, 100.0 * stage.utilization(elapsed), avgDepth, stage.depthMax))
+        return "\n".join(lines)
 
-    nextModelFileWithoutExt        = nextModelFile[0:nextModelFile.rfind('.')]
-    nextModelFileWithoutExtAndPath = os.path.basename(nextModelFileWithoutExt)
+# #############################################################################
 
+def runPipeline(filesToProcess):
     if (accessToken == ""):
         print("Couldn't log in. Are your credentials valid?")
         sys.exit(1)
 
-    if (nextModelFile.endswith(".id")):
-        modelID = nextModelFile[:-3]
-    else:
-        fileExt = pathlib.Path(nextModelFile).suffix
+    pipelineSettings = settings.get("pipeline", {})
+    pipeline         = Pipeline(pipelineSettings.get("workers", {}), pipelineSettings.get("queueSize", 4), pipelineSettings.get("reportInterval", 30))
 
-        allVariantsInvalid = True
+    print("Running in pipeline mode.")
+    sys.stdout = JobOutput(sys.stdout)
+    try:
+        finishedJobs = pipeline.run(filesToProcess)
+    finally:
+        sys.stdout = sys.stdout.stream
 
-        # validate before uploading, to prevent unnecessary waiting and traffic
-        for variantName in userVariants["variants"]:
-            variant = userVariants["variants"][variantName]
+    print(pipeline.summary())
+    return finishedJobs
 
-            print("Validating configuration for variant \"" + variantName + "\".")
 
-            if (validateJSONWithAPISchema(variant["config"], SchemaJSONPath, False)):
-                allVariantsInvalid = False
+# ################################ #
+#          asyncio Engine          #
+# ################################ #
 
-        if (allVariantsInvalid):
-            print("No valid variant configuration found. Terminating.")
-            sys.exit(1)
+class AsyncHTTPClient:
+    """Small non-blocking HTTP/1.1 client on asyncio streams, used by the asyncio engine.
+
+    Like ConnectionPool, it keeps connections alive and reuses them per host. Responses
+    are read completely, which suits the JSON API calls it is used for - model files are
+    transferred by the (blocking) streaming functions on worker threads instead.
+    """
+
+    def __init__(self, maxSize=8, idleTimeout=60.0, timeout=300.0):
+        self.maxSize     = maxSize
+        self.idleTimeout = idleTimeout
+        self.timeout     = timeout
+        self._idle       = {}   # (scheme, host, port) -> list of (reader, writer, time of release)
+        self._sslContext = ssl.create_default_context()
+
+    async def request(self, method, url, body=None, headers=None):
+        parts  = urllib.parse.urlsplit(url)
+        port   = parts.port or (443 if parts.scheme == "https" else 80)
+        key    = (parts.scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        requestHeaders = {"Host" : parts.netloc, "Accept-Encoding" : "identity"}
+        requestHeaders.update(headers or {})
+        if body is not None:
+            requestHeaders["Content-Length"] = str(len(body))
+        head = method + " " + target + " HTTP/1.1\r\n"
+        for name, value in requestHeaders.items():
+            head += name + ": " + str(value) + "\r\n"
+        message = (head + "\r\n").encode("latin-1") + (body or b"")
+
+        while True:
+            reader, writer, reused = await self._acquire(key)
+            try:
+                writer.write(message)
+                await writer.drain()
+                status, reason, responseHeaders, responseBody, keepAlive = await asyncio.wait_for(self._readResponse(reader, method), self.timeout)
+            except ConnectionError:
+                writer.close()
+                # the server may have closed an idle keep-alive connection - retry on another one
+                # (timeouts and other errors are not retried here, see executeServerRequestAsync)
+                if reused:
+                    continue
+                raise
+            except:
+                writer.close()
+                raise
+            break
+
+        if keepAlive:
+            self._release(key, reader, writer)
+        else:
+            writer.close()
+        return status, reason, responseHeaders, responseBody
+
+    async def closeAll(self):
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for reader, writer, releaseTime in connections:
+                writer.close()
+
+    async def _acquire(self, key):
+        now         = time.monotonic()
+        connections = self._idle.get(key, [])
+        while connections:
+            reader, writer, releaseTime = connections.pop()
+            if now - releaseTime <= self.idleTimeout and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        sslContext = self._sslContext if scheme == "https" else None
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=sslContext), self.timeout)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer):
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self.maxSize:
+            connections.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    async def _readResponse(self, reader, method):
+        statusLine = await reader.readline()
+        if not statusLine:
+            raise ConnectionResetError("Connection closed by server.")
+        statusParts = statusLine.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        version     = statusParts[0]
+        status      = int(statusParts[1])
+        reason      = statusParts[2] if len(statusParts) > 2 else ""
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+        keepAlive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or status < 200:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                chunkSize = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if chunkSize == 0:
+                    # skip trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body += await reader.readexactly(chunkSize)
+                await reader.readline()
+            body = bytes(body)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body      = await reader.read()
+            keepAlive = False
+        return status, reason, headers, body, keepAlive
+
+# #############################################################################
+
+async def executeServerRequestAsync(client, method, url, data=None, headers=None, idempotent=None):
+    headers = dict(headers or {})
+    headers.setdefault("User-Agent", DEFAULT_USER_AGENT)
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    rateLimiter = rateLimiterFor(method, url)
+
+    attempt = 1
+    delay   = 0
+    while True:
+        status = None
+        error  = None
+        if rateLimiter:
+            await asyncio.sleep(rateLimiter.reserve())
+        try:
+            status, reason, responseHeaders, body = await client.request(method, url, data, headers)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+            error = e
+
+        if rateLimiter and status:
+            if status == 429:
+                rateLimiter.onThrottled()
+            elif status < 400:
+                rateLimiter.onSuccess()
+
+        if error is None and status < 400:
+            return body, status
+        if not retryPolicy.shouldRetry(attempt, idempotent, status, error):
+            break
+
+        retryAfter = parseRetryAfter(responseHeaders.get("retry-after")) if status else None
+        delay      = retryPolicy.nextDelay(delay, retryAfter)
+        print("Request failed (" + (str(status) if status else str(error)) + "), retrying in {:.1f} seconds ...".format(delay))
+        await asyncio.sleep(delay)
+        attempt += 1
+
+    if error is not None:
+        print("******************************************************")
+        print("ERROR: Failed to fulfill the request.")
+        print("Reason: ", error)
+        print("******************************************************")
+        return None, None
+
+    printServerError(status, reason, body.splitlines(True))
+    return None, status
+
+# #############################################################################
+
+async def getServerRequestJSONAsync(client, method, url, accessToken, payload=None, idempotent=None):
+    reqHeaders = {'Authorization' : 'Bearer ' + accessToken,
+                  'Content-Type'  : 'application/json'}
+    data = json.dumps(payload).encode("utf8") if payload is not None else None
+
+    body, code = await executeServerRequestAsync(client, method, url, data, reqHeaders, idempotent)
+    if body is None:
+        return None, code
+
+    try:
+        return json.loads(body.decode("utf8")), code
+    except ValueError:
+        print("ERROR: Could not parse the result from server.")
+        return None, code
+
+# #############################################################################
+
+def runInTransferThread(fn, *args):
+    # blocking steps (file transfers, and the steps shared with the other modes) run on worker threads,
+    # in the context of the calling task - so that their output is labelled with its input file
+    return asyncio.wrap_future(submitInJobContext(transferExecutor, fn, *args))
+
+# #############################################################################
+
+async def waitForRawModelAsync(id, accessToken):
+    # wait until the server has unzipped (for zip files) and analysed the model
+    print("Waiting for the server to process the model.")
+    checkOptStatusURL = baseUrl+BASE_ASSET_ENDPOINT.replace("{id}", str(id))
+    rJSON = await asyncio.wrap_future(statusPoller.watch("rawmodel", id, checkOptStatusURL, accessToken, lambda rJSON: rJSON["data"]["upload_status"] == "complete"))
+    if rJSON == None:
+        print("Could not get the base asset status.")
+        return False
+
+    return True
+
+# #############################################################################
+
+async def waitForOptimizationAsync(jobLabel, rapidModelID, accessToken):
+    print(jobLabel + "Waiting for optimization to complete for rapid model " + str(rapidModelID))
+
+    lastProgress  = [None]
+    unexpectedRun = [False]
+
+    def check(rJSON):
+        # with many jobs at once, progress is reported line by line whenever it changes
+        if "data" in rJSON and "progress" in rJSON["data"]:
+            progress = (rJSON["data"]["progress"], rJSON["data"]["processing_step"])
+            if progress != lastProgress[0]:
+                print(jobLabel + "Progress: " + str(progress[0]) + "%" + ("  |  " + progress[1] if progress[1] else ""))
+                lastProgress[0] = progress
 
+        opt_status = rJSON["data"]["optimization_status"]
+        if (opt_status != "sent_to_queue" and opt_status != "done"):
+            print(jobLabel + "Error: Unexpected status code from optimization run (" + opt_status + ").")
+            unexpectedRun[0] = True
+            return None
+        return opt_status == "done"
+
+    # the status is polled by the central status poller, together with all other jobs
+    checkOptStatusURL = baseUrl+RAPID_MODEL_ENDPOINT.replace("{id}", str(rapidModelID))
+    rJSON = await asyncio.wrap_future(statusPoller.watch("rapidmodel", rapidModelID, checkOptStatusURL, accessToken, check))
+    if rJSON == None and not unexpectedRun[0]:
+        print(jobLabel + "Could not get the optimization status.")
+    return rJSON
+
+# #############################################################################
+
+async def generateOptimizedVariantAsync(client, jobLabel, modelID, outputs, variant, accessToken, journalEntry=None, runningRapidModelID=None):
+    # outputs, journalEntry and runningRapidModelID work like for generateOptimizedVariant
+    rJSON = None
+    if runningRapidModelID is not None:
+        print(jobLabel + "Continuing with rapid model " + str(runningRapidModelID) + " from an earlier run.")
+        rapidModelID = runningRapidModelID
+        rJSON        = await waitForOptimizationAsync(jobLabel, rapidModelID, accessToken)
+
+    if rJSON == None:
+        print(jobLabel + "Submitting optimization job ...")
+        rJSON, code = await getServerRequestJSONAsync(client, "POST", baseUrl+OPTIMIZE_MODEL_ENDPOINT.replace("{id}", str(modelID)), accessToken, variant)
+        if rJSON == None:
+            print(jobLabel + "Could not submit optimization job.")
+            if journalEntry:
+                journal.record(journalEntry[0], journalEntry[1], "failed")
+            return -1
+
+        rapidModelID = rJSON["id"]
+        if journalEntry:
+            journal.record(journalEntry[0], journalEntry[1], "submitted", rapidModelID)
+
+        rJSON = await waitForOptimizationAsync(jobLabel, rapidModelID, accessToken)
+        if rJSON == None:
+            if journalEntry:
+                journal.record(journalEntry[0], journalEntry[1], "failed", rapidModelID)
+            return -1
+
+    print(jobLabel + "Finished, downloading results ...")
+    if await runInTransferThread(downloadVariantResults, rJSON, variant, outputs) and journalEntry:
+        for variantKey in journalEntry[2]:
+            journal.record(journalEntry[0], variantKey, "downloaded", rapidModelID)
+
+    return rapidModelID
 
-        # 2) obtain signed URLs for upload
-        if (modelLabel != ""):
-            uploadURLs = getUploadURLs(fileExt, accessToken, modelLabel, baseUrl)
+# #############################################################################
+
+async def processModelFileAsync(client, semaphore, job, variants):
+    async with semaphore:
+        # like in --jobs mode, the output is labelled with the input file (each task has its own context)
+        currentJobLabel.set(job.label)
+        try:
+            if await runInTransferThread(planModelFile, job, variants):
+                # use an existing base asset, or upload the model file (hashing and uploading read the
+                # whole file, so the shared steps run in a worker thread)
+                await runInTransferThread(prepareBaseAsset, job)
+                if job.uploadURLs is not None:
+                    await runInTransferThread(uploadBaseAsset, job)
+                    if not await waitForRawModelAsync(job.modelID, accessToken):
+                        raise ModelFileError("Couldn't upload base asset.")
+                    finishBaseAssetUpload(job)
+
+                await produceVariantsAsync(client, job)
+        except ModelFileError as e:
+            job.fail(str(e))
+        except Exception as e:
+            # e.g. an unexpected response from the server - like in --jobs mode, the other files are still processed
+            job.fail("Error: Processing failed (" + repr(e) + ").")
+
+        # where desired, delete the base asset and the results from the cloud storage
+        await runInTransferThread(cleanupModelFile, job)
+        return job
+
+# #############################################################################
+
+async def produceVariantsAsync(client, job):
+    # all variants are created at once
+    variantSemaphore = asyncio.Semaphore(variantConcurrency)
+
+    async def produceVariant(variantName, variant):
+        async with variantSemaphore:
+            print("Producing asset variant \"" + variantName + "\".")
+            return await generateOptimizedVariantAsync(client, "[" + variantName + "] ", job.modelID, job.outputsOf(variantName), variant, accessToken,
+                                                       job.journalEntryOf(variantName), job.journalState.runningRapidModelID(job.jobKeys[variantName]))
+
+    # if a variant fails with an error, the others are still waited for - so that they are cleaned up, too
+    results = await asyncio.gather(*[produceVariant(variantName, variant) for variantName, variant in job.variants], return_exceptions=True)
+
+    errors = []
+    for (variantName, variant), resultRapidModelID in zip(job.variants, results):
+        if isinstance(resultRapidModelID, BaseException):
+            errors.append(resultRapidModelID)
+            job.failedVariants.add(variantName)
+        elif (resultRapidModelID != -1):
+            job.rapidModelIDs[variantName] = resultRapidModelID
         else:
-            uploadURLs = getUploadURLs(fileExt, accessToken, nextModelFileWithoutExtAndPath, baseUrl)
+            job.failedVariants.add(variantName)
+    if errors:
+        raise errors[0]
 
-        if (uploadURLs is None):
-            print("Couldn't obtain signed upload URLs from server.")
-            sys.exit(1)
+# #############################################################################
 
+async def runAsyncEngineMain(filesToProcess, maxInFlight):
+    # all files share the same variants, so validating them once is enough
+    variants = getValidVariants(False)
+    if not variants:
+        print("No valid variant configuration found. Terminating.")
+        sys.exit(1)
 
-        # 3) upload model into the "Base Assets" section, or take existing ID
-        success = uploadRawModel(nextModelFile, fileExt, uploadURLs, accessToken, baseUrl)
+    client        = AsyncHTTPClient(poolSettings.get("maxSize", 8), poolSettings.get("idleTimeout", 60), poolSettings.get("timeout", 300))
+    semaphore     = asyncio.Semaphore(maxInFlight)
+    modelFileJobs = [ModelFileJob(nextModelFile) for nextModelFile in filesToProcess]
+    try:
+        await asyncio.gather(*[processModelFileAsync(client, semaphore, job, variants) for job in modelFileJobs])
+    finally:
+        await client.closeAll()
+    return modelFileJobs
 
-        if (success == False):
-            print("Couldn't upload base asset.")
-            sys.exit(1)
+# #############################################################################
+
+def runAsyncEngine(filesToProcess, maxInFlight):
+    global transferExecutor
+
+    if (accessToken == ""):
+        print("Couldn't log in. Are your credentials valid?")
+        sys.exit(1)
 
-        modelID = uploadURLs['id']
+    print("Running with the asyncio engine, up to " + str(maxInFlight) + " files at once.")
+    transferExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=maxInFlight)
+    sys.stdout       = JobOutput(sys.stdout)
+    try:
+        return asyncio.run(runAsyncEngineMain(filesToProcess, maxInFlight))
+    finally:
+        sys.stdout = sys.stdout.stream
+        # the poller must not hand out status updates to the (finished) event loop anymore
+        statusPoller.close()
+        transferExecutor.shutdown()
 
 
-    # 4) create optimized variants
+# ################################ #
+#           Main Program           #
+# ################################ #
 
-    variantIdx = 0
+if __name__ == "__main__":
+    # argument parsing
+
+    parser = ArgumentParser()
+
+    parser.add_argument("model",                    help="input directory or 3D model (must be a .glb file OR .zip file OR base asset ID in the form <number>.id)")
+    parser.add_argument("-b", "--base-url", dest="baseUrl", default="https://api.rapidcompact.com/api/v2/", help="api base url")
+    parser.add_argument("-c", "--credentials-file", dest="credentialsFile", default="credentials.json", help="credentials JSON file")
+    parser.add_argument("-v", "--variants-file", dest="variantsFile", default="variants.json", help="variant definitions JSON file")
+    parser.add_argument("-s", "--settings-file", dest="settingsFile", default="settings.json", help="settings JSON file")
+    parser.add_argument("-l", "--label",  dest="modelLabel", default="", help="label for the model")
+    parser.add_argument("-o", "--origin", dest="originDesc", default="Gallery Uploader Script", help="origin label for the model")
+    parser.add_argument('--cleanup',    dest='cleanup', action='store_true')
+    parser.add_argument('--no-cleanup', dest='cleanup', action='store_false')
+    parser.add_argument("-e", "--exit", dest="exitOnError", default=False, help="exit script on optimize error. Set False or True")
+    parser.add_argument("--variant-concurrency", dest="variantConcurrency", type=int, default=4, help="maximum number of variants of one input file optimized at once (1: one after the other)")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1, help="number of input files processed at once in directory mode")
+    parser.add_argument("--webhook", dest="webhook", action="store_true", help="wait for job notifications on a local HTTP listener instead of polling, see \"webhook\" in the settings file")
+    parser.add_argument("--pipeline", dest="pipeline", action="store_true", help="process input files in overlapping stages (upload, optimization, download), see \"pipeline\" in the settings file")
+    parser.add_argument("--async", dest="asyncEngine", action="store_true", help="process input files concurrently with the asyncio engine")
+    parser.add_argument("--resume", dest="resume", action="store_true", help="continue where an interrupted run has stopped: skip finished variants, reuse uploaded base assets and running optimizations")
+    parser.add_argument("--max-in-flight", dest="maxInFlight", type=int, default=16, help="maximum number of input files processed at once by the asyncio engine")
+
+    parser.set_defaults(cleanup=True)
+
+    pArgs     = parser.parse_args()
+    argsDict = vars(pArgs)
+
+    modelFile       = argsDict["model"]
+    variantsFile    = argsDict["variantsFile"]
+    credentialsFile = argsDict["credentialsFile"]
+    settings_file   = argsDict["settingsFile"]
+    modelLabel      = argsDict["modelLabel"]
+    originDesc      = argsDict["originDesc"]
+    baseUrl         = argsDict["baseUrl"]
+    cleanup         = argsDict["cleanup"]
+    exitOnError     = argsDict["exitOnError"]
+    asyncEngine     = argsDict["asyncEngine"]
+    maxInFlight     = max(1, argsDict["maxInFlight"])
+    variantConcurrency = max(1, argsDict["variantConcurrency"])
+    jobs            = max(1, argsDict["jobs"])
+    pipelineMode    = argsDict["pipeline"]
+    webhookMode     = argsDict["webhook"]
+    resume          = argsDict["resume"]
+
+
+    print("API Endpoint: "+baseUrl)
+
+    userCredentials = None
+    userVariants    = None
+    settings        = None
 
-    newRapidModelIDs = []
+    try:
+        with open(credentialsFile) as f:
+            userCredentials = json.load(f)
+    except:
+        print("Unable to load and parse credentials JSON file \"" + credentialsFile + "\". Make sure the file exists and is valid JSON.")
+        sys.exit(1)
 
-    for variantName in userVariants["variants"]:
+    try:
+        with open(variantsFile) as f:
+            userVariants = json.load(f)
+    except:
+        print("Unable to load and parse variant definitions JSON file \"" + variantsFile + "\". Make sure the file exists and is valid JSON.")
+        sys.exit(1)
 
-        variant = userVariants["variants"][variantName]
+    try:
+        with open(settings_file) as f:
+            settings = json.load(f)
+    except(OSError, json.JSONDecodeError):
+        print("Unable to load and parse settings JSON file \"" + settings_file + "\". Make sure the file exists and is valid JSON.")
+        sys.exit(1)
 
-        # check if output folder exists
-        if not os.path.isdir("output"):
-            os.mkdir("output")
+    # Load Settings
+    SchemaJSONPath = settings["schemaPath"]
 
-        outputModelFilePrefix = "output/" + nextModelFileWithoutExtAndPath + "_" + variantName
+    # local state (checkpoints, caches) is kept in this directory
+    cacheDir = settings.get("cacheDir", ".rpdc-cache")
 
-        print("Producing asset variant \"" + variantName + "\".")
+    # validation results are kept for later runs, unless disabled
+    validationCacheEnabled = settings.get("validationCache", {}).get("enabled", True)
 
-        if (validateJSONWithAPISchema(variant["config"], SchemaJSONPath, True)):
-            if (validateJSONConfigContent(variant["config"])):
-                resultRapidModelID = generateOptimizedVariant(modelID, outputModelFilePrefix, variant, accessToken, baseUrl)
-                if (resultRapidModelID != -1):
-                    newRapidModelIDs.append(resultRapidModelID)
-                else:
-                    failedOptimizations += 1
+    # persistent connections, kept separately for the API host and the storage host
+    poolSettings          = settings.get("connectionPool", {})
+    apiConnectionPool     = ConnectionPool(poolSettings.get("maxSize", 8), poolSettings.get("idleTimeout", 60), poolSettings.get("timeout", 300))
+    storageConnectionPool = ConnectionPool(poolSettings.get("maxSize", 8), poolSettings.get("idleTimeout", 60), poolSettings.get("timeout", 300))
 
-        variantIdx += 1
+    retrySettings = settings.get("retry", {})
+    retryPolicy   = RetryPolicy(retrySettings.get("maxAttempts", 5), retrySettings.get("baseDelay", 1.0), retrySettings.get("maxDelay", 60.0), retrySettings.get("budget", 1000))
 
+    # requests to the API host are limited separately for status polls and other calls
+    rateLimitSettings   = settings.get("rateLimit", {})
+    pollingRateLimiter  = TokenBucket(rateLimitSettings.get("pollingPerSecond", 5), rateLimitSettings.get("pollingBurst", 10), rateLimitSettings.get("minPerSecond", 0.2))
+    mutatingRateLimiter = TokenBucket(rateLimitSettings.get("mutatingPerSecond", 2), rateLimitSettings.get("mutatingBurst", 5), rateLimitSettings.get("minPerSecond", 0.2))
 
-    # 5) where desired, delete the base asset from the cloud storage after optimization
+    # base assets are only kept and reused if enabled, since they take up storage space in the account
+    baseAssetCacheSettings = settings.get("baseAssetCache", {})
+    baseAssetCache         = BaseAssetCache(os.path.join(cacheDir, "base-assets.sqlite")) if baseAssetCacheSettings.get("enabled", False) else None
+
+    # downloaded results are only kept if enabled, since they take up disk space
+    resultCacheSettings = settings.get("resultCache", {})
+    resultCache         = None
+    if resultCacheSettings.get("enabled", False):
+        resultCache = ResultCache(os.path.join(cacheDir, "results"), int(resultCacheSettings.get("maxSizeMB", 2048) * 1024 * 1024), SchemaJSONPath)
+
+    # the progress on all files is recorded, so that an interrupted run can be resumed
+    journal = Journal(os.path.join(cacheDir, "journal.sqlite"))
+
+    # results of GET requests to the API, for conditional requests
+    responseCache = ResponseCache(settings.get("responseCacheEntries", 10000))
+
+    # status polls of all jobs are scheduled together
+    pollerSettings = settings.get("poller", {})
+    statusPoller   = StatusPoller(pollerSettings.get("maxInFlight", 4), pollerSettings.get("rawModelInterval", 1.0), pollerSettings.get("rapidModelInterval", 2.0),
+                                  pollerSettings.get("adaptive", True), pollerSettings.get("minInterval", 0.5), pollerSettings.get("maxInterval", 30.0))
+
+    # in webhook mode, optimizations are only polled slowly, in case a notification gets lost
+    webhookSettings = settings.get("webhook", {})
+    webhookReceiver = None
+    if webhookMode:
+        try:
+            webhookReceiver = WebhookReceiver(webhookSettings.get("host", "127.0.0.1"), webhookSettings.get("port", 8089), webhookSettings.get("path", "/rpdc-webhook"), webhookSettings.get("secret", ""))
+        except OSError as e:
+            print("Unable to start the webhook listener (" + str(e) + ").")
+            sys.exit(1)
+        print("Waiting for job notifications at " + webhookReceiver.url() + ".")
+        statusPoller.adaptive                = False
+        statusPoller.intervals["rapidmodel"] = webhookSettings.get("fallbackInterval", 60.0)
+
+    downloadSettings     = settings.get("downloads", {})
+    preallocateDownloads = downloadSettings.get("preallocate", True)
+    downloadParallelism  = downloadSettings.get("parallelism", 4)
+    downloadRangeSize    = int(downloadSettings.get("rangeSizeMB", 16) * 1024 * 1024)
+    downloadRetries      = downloadSettings.get("retries", 3)
+
+    # output files with the same content are only stored once, as reflinks or hardlinks
+    outputDeduplicator = OutputDeduplicator(downloadSettings.get("hardlinks", True)) if downloadSettings.get("deduplicate", True) else None
+
+    # multipart uploads are only used for large files, and only if the server hands out part URLs
+    multipartSettings      = settings.get("multipartUpload", {})
+    multipartUploadEnabled = multipartSettings.get("enabled", False)
+    multipartThreshold     = int(multipartSettings.get("thresholdMB", 100) * 1024 * 1024)
+    multipartPartSize      = int(multipartSettings.get("partSizeMB", 64) * 1024 * 1024)
+    multipartParallelism   = multipartSettings.get("parallelism", 4)
+
+    # 1) obtain token from credentials file
+
+    accessToken = userCredentials["token"]
+
+    # iterate over input directory OR use input file
+    directoryMode = os.path.isdir(modelFile)
+    filesToProcess =[]
+
+    if directoryMode:
+        print("Running in directory mode.")
+        filesToProcess = os.listdir(modelFile)
+        # to streamline code below, add the path prefix, just like in single-file mode
+        for i in range(0, len(filesToProcess)):
+            filesToProcess[i] = os.path.join(modelFile, filesToProcess[i])
+    else:
+        print("Running in single-file mode.")
+        filesToProcess = [modelFile]
+
+    # on Ctrl+C, stop waiting for running jobs right away - the journal keeps track of them for --resume
+    def onInterrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        statusPoller.cancel()
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGINT, onInterrupt)
+
+    try:
+        if asyncEngine:
+            modelFileJobs = runAsyncEngine(filesToProcess, maxInFlight)
+        elif pipelineMode:
+            modelFileJobs = runPipeline(filesToProcess)
+        elif jobs > 1 and len(filesToProcess) > 1:
+            modelFileJobs = processModelFiles(filesToProcess, jobs)
+        else:
+            # the output of variants produced at once is passed on line by line, see produceVariants
+            if variantConcurrency > 1:
+                sys.stdout = JobOutput(sys.stdout)
+            modelFileJobs = []
+            for nextModelFile in filesToProcess:
+                job = ModelFileJob(nextModelFile)
+                try:
+                    processModelFile(job)
+                except ModelFileError as e:
+                    print(str(e))
+                    sys.exit(1)
+                modelFileJobs.append(job)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Run again with --resume to continue where this run has stopped.")
+        sys.exit(130)
+
+    # For ExitOnError Flag
+    failedOptimizations = sum(job.failedOptimizations() for job in modelFileJobs)
+    failedFiles         = reportFailedFiles(modelFileJobs)
+
+    statusPoller.close()
+    if webhookReceiver is not None:
+        webhookReceiver.close()
+        print("Job notifications: " + str(webhookReceiver.notifications) + " received.")
+    apiConnectionPool.closeAll()
+    storageConnectionPool.closeAll()
+
+    if outputDeduplicator is not None and outputDeduplicator.linked > 0:
+        print("Output deduplication: " + str(outputDeduplicator.linked) + " files linked, {:.2f} MB saved.".format(outputDeduplicator.savedBytes / (1024 * 1024)))
+    if resultCache is not None and resultCache.hits > 0:
+        print("Result cache: " + str(resultCache.hits) + " variants taken from the cache.")
+    if statusPoller.jobs > 0:
+        print("Status polls: " + str(statusPoller.polls) + " requests for " + str(statusPoller.jobs) + " jobs, " + str(responseCache.hits) + " unchanged.")
+    if retryPolicy.retries > 0 or retryPolicy.exhausted > 0:
+        print("Retries: " + retryPolicy.summary() + ".")
+    if pollingRateLimiter.throttled > 0 or mutatingRateLimiter.throttled > 0:
+        print("Rate limits: server throttled " + str(pollingRateLimiter.throttled + mutatingRateLimiter.throttled) + " requests, " +
+              "adapted to {:.2f} polls/s and {:.2f} other requests/s.".format(pollingRateLimiter.rate, mutatingRateLimiter.rate))
+
+    # Exit with error
+    if(failedFiles > 0):
+        # same exit code as in sequential mode, where such a file ends the run
+        print("Exiting with error because not all input files could be processed")
+        sys.exit(1)
 
-    if (not nextModelFile.endswith(".id")):
-        fileExt = pathlib.Path(nextModelFile).suffix
-        if (cleanup):
-            print("Cleaning up: deleting uploaded base asset and optimized results. If you want to skip this step, run again with option --no-cleanup.")
-            deleteBaseAsset(uploadURLs['id'], accessToken)
-            for rapidModelID in newRapidModelIDs:
-                deleteRapidModel(rapidModelID, accessToken)
-
-# Exit with error
-if(exitOnError and failedOptimizations > 0):
-    print("Exiting with error because of failed optimizations")
-    sys.exit(OPTIMIZATION_FAILED_ERROR)
\ No newline at end of file
+    if(exitOnError and failedOptimizations > 0):
+        print("Exiting with error because of failed optimizations")
+        sys.exit(OPTIMIZATION_FAILED_ERROR)
\ No newline at end of file
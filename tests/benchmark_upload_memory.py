@@ -0,0 +1,111 @@
+"""Benchmark: peak memory (RSS) of uploading model files of growing size.
+
+Uploads files of each size to the local stand-in (tests/fakeapi.py) the way rpdc.py does
+(getUploadURLs, then uploadModelData), each in a fresh process, and reports the peak RSS
+of that process against the file size. Since the upload is streamed from disk, the peak
+RSS should stay the same for all sizes. With --compare, the same file is also sent as
+one in-memory body (the file read completely first), for reference.
+
+    python tests/benchmark_upload_memory.py [--sizes 16 64 256 1024] [--multipart] [--compare]
+
+Needs the resource module, i.e. Linux or macOS.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakeapi import FakeAPI
+
+
+def peakRSS():
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRSS if sys.platform == "darwin" else maxRSS * 1024
+
+# #############################################################################
+
+def uploadInThisProcess(baseUrl, modelFile, mode):
+    import rpdc
+
+    rpdc.baseUrl               = baseUrl
+    rpdc.apiConnectionPool     = rpdc.ConnectionPool()
+    rpdc.storageConnectionPool = rpdc.ConnectionPool()
+    rpdc.retryPolicy           = rpdc.RetryPolicy(1)
+    rpdc.pollingRateLimiter    = None
+    rpdc.mutatingRateLimiter   = None
+    rpdc.multipartParallelism  = 4
+
+    baselineRSS = peakRSS()
+    startTime   = time.monotonic()
+    if mode == "whole-file":
+        uploadURLs = rpdc.getUploadURLs(".glb", "token", "benchmark", baseUrl)
+        with open(modelFile, 'rb') as f:
+            data = f.read()
+        req = urllib.request.Request(uploadURLs['links']['s3_upload_urls']['rapid.glb'], data=data, method='PUT')
+        success = rpdc.executeServerRequest(req)[0] is not None
+    else:
+        partCount  = -(-os.path.getsize(modelFile) // (64 * 1024 * 1024)) if mode == "multipart" else 1
+        uploadURLs = rpdc.getUploadURLs(".glb", "token", "benchmark", baseUrl, partCount)
+        success    = rpdc.uploadModelData(modelFile, ".glb", uploadURLs)
+    seconds = time.monotonic() - startTime
+    sys.stderr.write(" ".join(str(value) for value in (int(success), baselineRSS, peakRSS(), seconds)) + "\n")
+
+# #############################################################################
+
+def measureUpload(fake, modelFile, mode):
+    # each upload runs in its own process, so that its peak RSS isn't hidden by an earlier, larger one
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", fake.baseUrl, modelFile, mode],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    success, baselineRSS, maxRSS, seconds = process.stderr.split()[-4:]
+    if success != "1":
+        raise RuntimeError("Upload of " + modelFile + " failed:\n" + process.stderr)
+    return int(baselineRSS), int(maxRSS), float(seconds)
+
+# #############################################################################
+
+def runBenchmark(sizesMB, multipart, compare):
+    fake  = FakeAPI(multipart=multipart).start()
+    modes = ["multipart" if multipart else "streamed"] + (["whole-file"] if compare else [])
+    MB    = 1024 * 1024
+
+    print("{:>10}  {:<10}  {:>14}  {:>14}  {:>10}".format("file size", "upload", "peak RSS", "RSS growth", "MB/s"))
+    try:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            for sizeMB in sizesMB:
+                modelFile = os.path.join(tmpDir, "model.glb")
+                with open(modelFile, 'wb') as f:
+                    # random content, so that nothing on the way can compress it
+                    for i in range(sizeMB):
+                        f.write(os.urandom(MB))
+                for mode in modes:
+                    baselineRSS, maxRSS, seconds = measureUpload(fake, modelFile, mode)
+                    print("{:>7} MB  {:<10}  {:>11.1f} MB  {:>11.1f} MB  {:>10.1f}".format(
+                          sizeMB, mode, maxRSS / MB, (maxRSS - baselineRSS) / MB, sizeMB / max(seconds, 1e-6)))
+                    uploaded = [size for size, sha256 in fake.uploads.values()]
+                    if not uploaded or max(uploaded) != sizeMB * MB:
+                        raise RuntimeError("The stand-in didn't receive the whole file.")
+                    fake.uploads.clear()
+                os.remove(modelFile)
+    finally:
+        fake.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        uploadInThisProcess(*sys.argv[2:])
+        sys.exit(0)
+
+    parser = ArgumentParser()
+    parser.add_argument("--sizes",     type=int, nargs="+", default=[16, 64, 256, 1024], help="file sizes in MB")
+    parser.add_argument("--multipart", action="store_true", help="upload in parts of 64 MB, 4 at once")
+    parser.add_argument("--compare",   action="store_true", help="also upload each file read completely into memory")
+    args = parser.parse_args()
+    runBenchmark(args.sizes, args.multipart, args.compare)
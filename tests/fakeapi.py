@@ -0,0 +1,264 @@
+"""Local stand-in for the RapidCompact API and the presigned storage URLs it hands out.
+
+Used by the tests and benchmarks, which start it with FakeAPI().start() and point rpdc at
+FakeAPI.baseUrl. It can also be run on its own, to try rpdc.py without an account:
+
+    python tests/fakeapi.py [port]
+    python rpdc.py -b http://127.0.0.1:<port>/api/v2/ <model>
+
+(with any token in credentials.json). Base assets are "processed" after a few status
+polls, optimizations after a few more, and every export of a rapid model is a download
+of downloadSize bytes. Uploads are only hashed, not stored, so that the stand-in stays
+small even for large files.
+"""
+
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def readBody(self, sink=None):
+        # read the request body in chunks, passing each to sink (if given) instead of keeping it
+        remaining = int(self.headers.get("Content-Length", 0) or 0)
+        chunks    = []
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if sink:
+                sink(chunk)
+            else:
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def sendJSON(self, code, obj):
+        self.sendData(code, json.dumps(obj).encode("utf8"), {"Content-Type": "application/json"})
+
+    def sendData(self, code, data, headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def route(self):
+        fake = self.server.fakeAPI
+        with fake.lock:
+            fake.requests.append((self.command, self.path, self.headers.get("Range")))
+        if self.server is fake.apiServer:
+            self.handleAPI(fake)
+        else:
+            self.handleStorage(fake)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = route
+
+    # API ######################################################################
+
+    def handleAPI(self, fake):
+        path = self.path.split("?")[0]
+
+        if path.endswith("/rawmodel/api-upload/start") and self.command == "POST":
+            request  = json.loads(self.readBody())
+            id       = fake.newID()
+            fileName = request["filenames"][0]
+            fake.rawModels[id] = {"polls": 0}
+            links = {"s3_upload_urls": {fileName: fake.storageUrl + "raw/" + str(id) + "/" + fileName}}
+            if fake.multipart and "multipart" in request:
+                partCount = request["multipart"]["part_count"]
+                fileURL   = fake.storageUrl + "raw/" + str(id) + "/" + fileName + "?uploadId=u" + str(id)
+                links["s3_multipart_upload_urls"] = {fileName: {
+                    "parts":    [fileURL + "&partNumber=" + str(partNumber + 1) for partNumber in range(partCount)],
+                    "complete": fileURL,
+                    "abort":    fileURL}}
+            return self.sendJSON(200, {"id": id, "links": links})
+
+        match = re.search(r"/rawmodel/(\d+)/api-upload/complete$", path)
+        if match:
+            self.readBody()
+            if int(match.group(1)) not in fake.rawModels:
+                return self.sendJSON(404, {"message": "not found", "errors": {}})
+            return self.sendJSON(200, {})
+
+        match = re.search(r"/rawmodel/optimize/(\d+)$", path)
+        if match and self.command == "POST":
+            variant = json.loads(self.readBody())
+            id      = fake.newID()
+            fake.rapidModels[id] = {"polls": 0, "exports": len(variant["config"]["compressionAndExport"]["fileExports"])}
+            return self.sendJSON(200, {"id": id})
+
+        match = re.search(r"/(rawmodel|rapidmodel)/(\d+)$", path)
+        if match:
+            models = fake.rawModels if match.group(1) == "rawmodel" else fake.rapidModels
+            id     = int(match.group(2))
+            if self.command == "DELETE":
+                models.pop(id, None)
+                return self.sendJSON(200, {})
+            if id not in models:
+                return self.sendJSON(404, {"message": "not found", "errors": {}})
+            model = models[id]
+            model["polls"] += 1
+            if models is fake.rawModels:
+                status = "complete" if model["polls"] > fake.processingPolls else "processing"
+                return self.sendJSON(200, {"data": {"id": id, "upload_status": status}})
+            progress = min(100, model["polls"] * 100 // max(1, fake.processingPolls))
+            data     = {"id": id, "progress": progress, "processing_step": "baking" if progress < 100 else None,
+                        "optimization_status": "done" if progress >= 100 else "sent_to_queue"}
+            if progress >= 100:
+                data["downloads"] = {"all": {"export" + str(k): fake.outputURL(id, k) for k in range(model["exports"])}}
+            return self.sendJSON(200, {"data": data})
+
+        return self.sendJSON(404, {"message": "no route " + path, "errors": {}})
+
+    # Storage ##################################################################
+
+    def handleStorage(self, fake):
+        path  = self.path.split("?")[0]
+        query = self.path.split("?")[1] if "?" in self.path else ""
+
+        if self.command == "PUT":
+            sha256 = hashlib.sha256()
+            size   = [0]
+            def sink(chunk):
+                sha256.update(chunk)
+                size[0] += len(chunk)
+            self.readBody(sink)
+            partNumber = re.search(r"partNumber=(\d+)", query)
+            key        = (path, int(partNumber.group(1))) if partNumber else path
+            with fake.lock:
+                fake.uploads[key] = (size[0], sha256.hexdigest())
+            return self.sendData(200, b"", {"ETag": "\"" + sha256.hexdigest()[:32] + "\""})
+
+        if self.command == "POST" and "uploadId" in query:
+            partNumbers = [int(n) for n in re.findall(r"<PartNumber>(\d+)</PartNumber>", self.readBody().decode("utf8"))]
+            with fake.lock:
+                fake.uploads[path] = (sum(fake.uploads[(path, n)][0] for n in partNumbers), None)
+            return self.sendData(200, b"<CompleteMultipartUploadResult/>")
+
+        if self.command == "DELETE":
+            return self.sendData(204, b"")
+
+        match = re.search(r"/out/(\d+)/(\d+)$", path)
+        if match:
+            return self.sendOutput(fake, fake.outputData(int(match.group(1)), int(match.group(2))))
+
+        return self.sendJSON(404, {"message": "no such key", "errors": {}})
+
+    def sendOutput(self, fake, data):
+        etag    = "\"" + hashlib.md5(data).hexdigest() + "\""
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        code    = 200
+        start   = 0
+        end     = len(data) - 1
+        rangeHeader = self.headers.get("Range")
+        # a range of a file which has changed in the meantime (If-Range) is answered with all of it
+        if rangeHeader and self.headers.get("If-Range", etag) == etag:
+            first, last = rangeHeader.split("=")[1].split("-")
+            start = int(first)
+            end   = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start >= len(data):
+                return self.sendData(416, b"", {"Content-Range": "bytes */" + str(len(data))})
+            code = 206
+            headers["Content-Range"] = "bytes " + str(start) + "-" + str(end) + "/" + str(len(data))
+
+        body = data[start:end + 1]
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if len(body) > 1 and fake.shouldCut():
+            # drop the connection in the middle of the response
+            self.wfile.write(body[:fake.random.randint(1, len(body) - 1)])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class FakeAPI:
+    """Runs the API and the storage stand-in on two local ports.
+
+    cutConnections is the probability with which a download is cut off after a random
+    number of bytes, multipart enables multipart upload URLs, processingPolls is the
+    number of status polls after which base assets and rapid models are finished.
+    """
+
+    def __init__(self, port=0, downloadSize=300000, cutConnections=0.0, multipart=False, processingPolls=2, seed=None):
+        self.downloadSize    = downloadSize
+        self.cutConnections  = cutConnections
+        self.multipart       = multipart
+        self.processingPolls = processingPolls
+        self.random          = random.Random(seed)
+        self.rawModels       = {}
+        self.rapidModels     = {}
+        self.uploads         = {}    # storage path (and part number) -> (size, sha256)
+        self.requests        = []    # (method, path, Range header) of every request
+        self.lock            = threading.Lock()
+        self._nextID         = int(time.time() * 1000) % 10**9
+        self.apiServer       = ThreadingHTTPServer(("127.0.0.1", port), FakeAPIHandler)
+        self.storageServer   = ThreadingHTTPServer(("127.0.0.1", port + 1 if port else 0), FakeAPIHandler)
+        self.apiServer.fakeAPI     = self
+        self.storageServer.fakeAPI = self
+        self.apiServer.daemon_threads     = True
+        self.storageServer.daemon_threads = True
+
+    @property
+    def baseUrl(self):
+        return "http://127.0.0.1:" + str(self.apiServer.server_address[1]) + "/api/v2/"
+
+    @property
+    def storageUrl(self):
+        return "http://127.0.0.1:" + str(self.storageServer.server_address[1]) + "/"
+
+    def start(self):
+        for server in (self.apiServer, self.storageServer):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        for server in (self.apiServer, self.storageServer):
+            server.shutdown()
+            server.server_close()
+
+    def newID(self):
+        with self.lock:
+            self._nextID += 1
+            return self._nextID
+
+    def shouldCut(self):
+        with self.lock:
+            return self.random.random() < self.cutConnections
+
+    def outputURL(self, rapidModelID, exportIdx):
+        # presigned, like the real ones - the signature must not matter for resuming
+        return self.storageUrl + "out/" + str(rapidModelID) + "/" + str(exportIdx) + "?signature=" + str(self.newID())
+
+    def outputData(self, rapidModelID, exportIdx):
+        line = ("rapid model " + str(rapidModelID) + " export " + str(exportIdx) + "\n").encode("utf8")
+        return (line * (self.downloadSize // len(line) + 1))[:self.downloadSize]
+
+
+if __name__ == "__main__":
+    fake = FakeAPI(int(sys.argv[1]) if len(sys.argv) > 1 else 8765, multipart=True).start()
+    print("API at " + fake.baseUrl + ", storage at " + fake.storageUrl)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.close()
@@ -0,0 +1,182 @@
+"""Tests for resuming downloads (DownloadState and downloadFile against the local stand-in)."""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rpdc
+from fakeapi import FakeAPI
+
+
+class DownloadStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path   = os.path.join(self.tmpDir.name, "out.glb.part.json")
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_missing_ranges_of_empty_state(self):
+        state = rpdc.DownloadState(self.path, "http://host/file", 10, None)
+        self.assertEqual(state.missingRanges(4), [(0, 3), (4, 7), (8, 9)])
+        self.assertEqual(state.missingRanges(4, fromByte=4), [(4, 7), (8, 9)])
+        self.assertFalse(state.isComplete())
+
+    def test_missing_ranges_between_received_ranges(self):
+        state = rpdc.DownloadState(self.path, "http://host/file", 20, None)
+        state.addRange(2, 5)
+        state.addRange(12, 13)
+        self.assertEqual(state.missingRanges(4), [(0, 1), (6, 9), (10, 11), (14, 17), (18, 19)])
+
+    def test_adjacent_and_overlapping_ranges_are_merged(self):
+        state = rpdc.DownloadState(self.path, "http://host/file", 20, None)
+        state.addRange(10, 14)
+        state.addRange(0, 4)
+        state.addRange(5, 7)
+        state.addRange(6, 11)
+        self.assertEqual(state.ranges, [[0, 14]])
+        state.addRange(15, 19)
+        self.assertTrue(state.isComplete())
+        self.assertEqual(state.missingRanges(4), [])
+
+    def test_load_returns_saved_state(self):
+        partPath = self.path[:-len(".json")]
+        with open(partPath, "wb") as f:
+            f.truncate(20)
+        state = rpdc.DownloadState(self.path, "http://host/file?signature=1", 20, "\"etag\"")
+        state.addRange(0, 9)
+
+        # the signature of the presigned URL is not stored, a new one matches as well
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["url"], "http://host/file")
+        loaded = rpdc.DownloadState.load(self.path, partPath, "http://host/file?signature=2")
+        self.assertEqual((loaded.size, loaded.etag, loaded.ranges), (20, "\"etag\"", [[0, 9]]))
+
+        self.assertIsNone(rpdc.DownloadState.load(self.path, partPath, "http://host/other"))
+        with open(partPath, "wb") as f:
+            f.truncate(30)
+        self.assertIsNone(rpdc.DownloadState.load(self.path, partPath, "http://host/file"))
+
+    def test_load_ignores_broken_state(self):
+        partPath = self.path[:-len(".json")]
+        open(partPath, "wb").close()
+        with open(self.path, "w") as f:
+            f.write("{\"url\": ")
+        self.assertIsNone(rpdc.DownloadState.load(self.path, partPath, "http://host/file"))
+        self.assertIsNone(rpdc.DownloadState.load(self.path + ".missing", partPath, "http://host/file"))
+
+
+class DownloadFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpDir.name, "out.glb")
+        self.fake   = FakeAPI(downloadSize=1000000, seed=1).start()
+
+        # the settings rpdc.py reads from settings.json
+        rpdc.baseUrl               = self.fake.baseUrl
+        rpdc.apiConnectionPool     = rpdc.ConnectionPool(8, 60, 10)
+        rpdc.storageConnectionPool = rpdc.ConnectionPool(8, 60, 10)
+        rpdc.retryPolicy           = rpdc.RetryPolicy(5, 0.01, 0.05)
+        rpdc.pollingRateLimiter    = rpdc.TokenBucket(1000, 1000, 1)
+        rpdc.mutatingRateLimiter   = rpdc.TokenBucket(1000, 1000, 1)
+        rpdc.preallocateDownloads  = True
+        rpdc.downloadParallelism   = 4
+        rpdc.downloadRangeSize     = 64 * 1024
+        rpdc.downloadRetries       = 3
+        rpdc.outputDeduplicator    = None
+
+    def tearDown(self):
+        rpdc.storageConnectionPool.closeAll()
+        rpdc.apiConnectionPool.closeAll()
+        self.fake.close()
+        self.tmpDir.cleanup()
+
+    def download(self, url):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            success = rpdc.downloadFile(url, self.output)
+        return success, output.getvalue()
+
+    def assertDownloaded(self, rapidModelID):
+        with open(self.output, "rb") as f:
+            self.assertEqual(f.read(), self.fake.outputData(rapidModelID, 0))
+        self.assertEqual(sorted(os.listdir(self.tmpDir.name)), ["out.glb"])
+
+    def test_download_in_ranges(self):
+        success, output = self.download(self.fake.outputURL(1, 0))
+        self.assertTrue(success, output)
+        self.assertDownloaded(1)
+        ranges = [rangeHeader for method, path, rangeHeader in self.fake.requests]
+        self.assertEqual(len(ranges), -(-self.fake.downloadSize // rpdc.downloadRangeSize))
+        self.assertNotIn(None, ranges)
+
+    def test_download_survives_cut_connections(self):
+        # about half of the responses break off after a random number of bytes
+        self.fake.cutConnections = 0.5
+        rpdc.downloadRetries     = 100
+        for parallelism in (1, 4):
+            rpdc.downloadParallelism = parallelism
+            success, output = self.download(self.fake.outputURL(parallelism, 0))
+            self.assertTrue(success, output)
+            self.assertDownloaded(parallelism)
+            os.remove(self.output)
+        self.assertIn("Resuming download", output)
+
+    def test_interrupted_download_is_resumed_by_the_next_run(self):
+        # a run without retries, which ends with some of the ranges received
+        self.fake.cutConnections = 0.5
+        rpdc.downloadRetries     = 0
+        for rapidModelID in range(100, 120):
+            success, output = self.download(self.fake.outputURL(rapidModelID, 0))
+            received = []
+            if os.path.exists(self.output + ".part.json"):
+                with open(self.output + ".part.json") as f:
+                    received = json.load(f)["ranges"]
+            if not success and received:
+                break
+            for name in os.listdir(self.tmpDir.name):
+                os.remove(os.path.join(self.tmpDir.name, name))
+        self.assertFalse(success)
+        self.assertTrue(received)
+
+        # the next run gets a new presigned URL, and asks only for the missing ranges
+        del self.fake.requests[:]
+        self.fake.cutConnections = 0.0
+        success, output = self.download(self.fake.outputURL(rapidModelID, 0))
+        self.assertTrue(success, output)
+        self.assertIn("Resuming download", output)
+        self.assertDownloaded(rapidModelID)
+        for method, path, rangeHeader in self.fake.requests:
+            start, end = [int(n) for n in rangeHeader.split("=")[1].split("-")]
+            for receivedStart, receivedEnd in received:
+                self.assertTrue(end < receivedStart or start > receivedEnd, rangeHeader + " was received before")
+
+    def test_changed_file_is_downloaded_again(self):
+        partPath = self.output + ".part"
+        with open(partPath, "wb") as f:
+            f.write(b"x" * self.fake.downloadSize)
+        state = rpdc.DownloadState(partPath + ".json", self.fake.outputURL(3, 0), self.fake.downloadSize, "\"old\"")
+        state.addRange(0, self.fake.downloadSize // 2)
+
+        success, output = self.download(self.fake.outputURL(3, 0))
+        self.assertTrue(success, output)
+        self.assertIn("has to start over", output)
+        self.assertDownloaded(3)
+
+    def test_download_in_one_request(self):
+        rpdc.downloadParallelism = 1
+        success, output = self.download(self.fake.outputURL(4, 0))
+        self.assertTrue(success, output)
+        self.assertDownloaded(4)
+        self.assertEqual([rangeHeader for method, path, rangeHeader in self.fake.requests], [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
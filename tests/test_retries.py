@@ -0,0 +1,83 @@
+"""Tests for retrying and rate limiting requests."""
+
+import email.utils
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rpdc
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_only_safe_requests_are_retried(self):
+        policy = rpdc.RetryPolicy(maxAttempts=5)
+        self.assertTrue(policy.shouldRetry(1, True, 500))
+        self.assertTrue(policy.shouldRetry(1, True, error=ConnectionResetError()))
+        self.assertFalse(policy.shouldRetry(1, True, 404))
+        # a non-idempotent request may have been processed, unless the server rejected it
+        self.assertFalse(policy.shouldRetry(1, False, 500))
+        self.assertFalse(policy.shouldRetry(1, False, error=ConnectionResetError()))
+        self.assertTrue(policy.shouldRetry(1, False, 429))
+        self.assertTrue(policy.shouldRetry(1, False, 503))
+        self.assertTrue(policy.shouldRetry(1, False, error=ConnectionRefusedError()))
+        self.assertEqual(policy.reasons, {"500": 1, "ConnectionResetError": 1, "429": 1, "503": 1, "ConnectionRefusedError": 1})
+
+    def test_attempts_and_budget_are_limited(self):
+        policy = rpdc.RetryPolicy(maxAttempts=3, budget=4)
+        self.assertTrue(policy.shouldRetry(2, True, 502))
+        self.assertFalse(policy.shouldRetry(3, True, 502))
+        for attempt in range(3):
+            self.assertTrue(policy.shouldRetry(1, True, 502))
+        self.assertFalse(policy.shouldRetry(1, True, 502))
+        self.assertEqual((policy.retries, policy.exhausted), (4, 2))
+
+    def test_delay(self):
+        policy = rpdc.RetryPolicy(baseDelay=1.0, maxDelay=10.0)
+        self.assertEqual(policy.nextDelay(5.0, retryAfter=30.0), 30.0)
+        delay = 0
+        for attempt in range(20):
+            nextDelay = policy.nextDelay(delay)
+            self.assertGreaterEqual(nextDelay, 1.0)
+            self.assertLessEqual(nextDelay, min(10.0, max(1.0, delay * 3)))
+            delay = nextDelay
+
+    def test_retry_after(self):
+        self.assertIsNone(rpdc.parseRetryAfter(None))
+        self.assertIsNone(rpdc.parseRetryAfter("soon"))
+        self.assertEqual(rpdc.parseRetryAfter(" 7 "), 7.0)
+        inTenSeconds = rpdc.parseRetryAfter(email.utils.formatdate(time.time() + 10, usegmt=True))
+        self.assertTrue(8 <= inTenSeconds <= 10, inTenSeconds)
+        self.assertEqual(rpdc.parseRetryAfter(email.utils.formatdate(time.time() - 10, usegmt=True)), 0.0)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = rpdc.TokenBucket(10, 3, 1)
+        self.assertEqual([bucket.reserve() for i in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_rate_adapts_to_throttling(self):
+        bucket = rpdc.TokenBucket(8, 5, 1)
+        bucket.onThrottled()
+        self.assertEqual(bucket.rate, 4)
+        # at most one decrease per second
+        bucket.onThrottled()
+        self.assertEqual((bucket.rate, bucket.throttled), (4, 2))
+        bucket._lastDecrease -= 1.0
+        for i in range(3):
+            bucket.onThrottled()
+            bucket._lastDecrease -= 1.0
+        self.assertEqual(bucket.rate, 1)
+        for i in range(100):
+            bucket.onSuccess()
+        self.assertEqual(bucket.rate, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tests for merging variants and for resuming them from the journal."""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rpdc
+
+
+def makeVariant(faceCount, exports):
+    return {"config": {"decimate": {"target": "faces", "faces": faceCount},
+                       "compressionAndExport": {"textureFormat": "auto", "fileExports": exports}}}
+
+GLB  = {"fileType": "glb"}
+USDZ = {"fileType": "usdz"}
+OBJ  = {"fileType": "obj", "textureFormat": "png"}
+
+
+class MergeVariantsTest(unittest.TestCase):
+
+    def merge(self, variants):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return rpdc.mergeVariants(variants)
+
+    def test_variants_differing_in_exports_are_merged(self):
+        jobs, members = self.merge([("web", makeVariant(1000, [GLB])),
+                                    ("ar",  makeVariant(1000, [USDZ, GLB])),
+                                    ("old", makeVariant(1000, [OBJ]))])
+        self.assertEqual([jobName for jobName, jobVariant in jobs], ["web"])
+        self.assertEqual(jobs[0][1], makeVariant(1000, [GLB, USDZ, OBJ]))
+        # each variant knows which exports of the job are its own
+        self.assertEqual(members, {"web": [("web", [0]), ("ar", [1, 0]), ("old", [2])]})
+
+    def test_different_variants_are_not_merged(self):
+        variants = [("low", makeVariant(1000, [GLB])), ("high", makeVariant(5000, [GLB])), ("low-usdz", makeVariant(1000, [USDZ]))]
+        jobs, members = self.merge(variants)
+        self.assertEqual(jobs, [("low", makeVariant(1000, [GLB, USDZ])), ("high", makeVariant(5000, [GLB]))])
+        self.assertEqual(members, {"low": [("low", [0]), ("low-usdz", [1])], "high": [("high", [0])]})
+
+    def test_identical_variants_share_their_exports(self):
+        jobs, members = self.merge([("a", makeVariant(1000, [GLB])), ("b", makeVariant(1000, [GLB]))])
+        self.assertEqual(jobs, [("a", makeVariant(1000, [GLB]))])
+        self.assertEqual(members, {"a": [("a", [0]), ("b", [0])]})
+
+    def test_variants_are_not_changed(self):
+        variants = [("web", makeVariant(1000, [GLB])), ("ar", makeVariant(1000, [USDZ]))]
+        self.merge(variants)
+        self.assertEqual(variants, [("web", makeVariant(1000, [GLB])), ("ar", makeVariant(1000, [USDZ]))])
+
+
+class JournalStateTest(unittest.TestCase):
+
+    def replay(self, events):
+        state = rpdc.JournalState()
+        for variantKey, event, serverID in events:
+            state.replay(variantKey, event, serverID)
+        return state
+
+    def test_replay(self):
+        state = self.replay([("", "uploaded", "10"),
+                             ("web", "submitted", "20"),
+                             ("ar", "submitted", "21"),
+                             ("web", "downloaded", "20")])
+        self.assertEqual(state.rawModelID, "10")
+        self.assertTrue(state.isDownloaded("web"))
+        self.assertFalse(state.isDownloaded("ar"))
+        self.assertFalse(state.isDownloaded("unknown"))
+        self.assertIsNone(state.runningRapidModelID("web"))
+        self.assertEqual(state.runningRapidModelID("ar"), "21")
+        self.assertEqual(state.leftoverRapidModelIDs(["web", "ar"]), ["20"])
+
+    def test_merged_variants_share_their_rapid_model(self):
+        state = self.replay([("web", "downloaded", "20"), ("ar", "downloaded", "20"), ("old", "failed", "21")])
+        self.assertEqual(state.leftoverRapidModelIDs(["web", "ar", "old"]), ["20"])
+
+    def test_cleaned_file_has_no_server_assets_left(self):
+        state = self.replay([("", "uploaded", "10"), ("web", "downloaded", "20"), ("", "cleaned", None)])
+        self.assertIsNone(state.rawModelID)
+        self.assertTrue(state.isDownloaded("web"))
+        self.assertEqual(state.leftoverRapidModelIDs(["web"]), [])
+
+    def test_resubmitted_variant(self):
+        state = self.replay([("web", "failed", "20"), ("web", "submitted", "22")])
+        self.assertEqual(state.runningRapidModelID("web"), "22")
+
+    def test_journal_is_replayed_per_file(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            journal = rpdc.Journal(os.path.join(tmpDir, "journal.sqlite"))
+            journal.record("a", "", "uploaded", 10)
+            journal.record("b", "", "uploaded", 11)
+            journal.record("a", "web", "submitted", 20)
+            journal.record("a", "web", "downloaded", 20)
+            state = journal.stateOf("a")
+            self.assertEqual(state.rawModelID, "10")
+            self.assertTrue(state.isDownloaded("web"))
+            self.assertIsNone(journal.stateOf("c").rawModelID)
+
+    def test_finished_variants_are_skipped(self):
+        state    = self.replay([("web:1", "downloaded", "20"), ("ar:2", "submitted", "21")])
+        variants = [("web", makeVariant(1000, [GLB])), ("ar", makeVariant(1000, [USDZ]))]
+        with contextlib.redirect_stdout(io.StringIO()):
+            remaining, leftover = rpdc.skipFinishedVariants(state, {"web": "web:1", "ar": "ar:2"}, variants)
+        self.assertEqual(remaining, variants[1:])
+        self.assertEqual(leftover, ["20"])
+
+
+if __name__ == "__main__":
+    unittest.main()
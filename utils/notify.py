@@ -0,0 +1,60 @@
+import sys
+
+if sys.version_info[0] < 3 or (sys.version_info[0] == 3 and sys.version_info[1] < 8):
+    print('ERROR: This script requires Python 3.8 or higher')
+    sys.exit(1)
+
+import urllib.request
+import urllib.error
+import json
+from argparse import ArgumentParser
+
+# Sends a job notification to rpdc.py running with --webhook, just like the API would.
+# Useful where the API can't reach the listener, and for testing the webhook mode.
+
+
+# ################################ #
+#         Helper Functions         #
+# ################################ #
+
+
+def send_notification(webhook_url, kind, id, secret):
+    data = json.dumps({"kind": kind, "id": id}).encode("utf8")
+    req_headers = {"Content-Type": "application/json"}
+    if secret != "":
+        req_headers["X-RPDC-Token"] = secret
+
+    req = urllib.request.Request(webhook_url, data=data, headers=req_headers)
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.getcode() == 204
+    except urllib.error.URLError as e:
+        print("ERROR: Failed to send the notification.")
+        print("Reason: ", e.reason if hasattr(e, "reason") else e)
+        return False
+
+
+# ################################ #
+#           Main Program           #
+# ################################ #
+
+parser = ArgumentParser()
+parser.add_argument("ids", nargs="+", help="IDs of the finished rapid models (or base assets, see --kind)")
+parser.add_argument("-u", "--url", dest="webhookUrl", default="http://127.0.0.1:8089/rpdc-webhook",
+                    help="URL of the webhook listener")
+parser.add_argument("-k", "--kind", dest="kind", default="rapidmodel", choices=["rapidmodel", "rawmodel"],
+                    help="kind of the notified jobs")
+parser.add_argument("--secret", dest="secret", default="", help="shared secret, see \"webhook\" in the settings file")
+
+pArgs = parser.parse_args()
+argsDict = vars(pArgs)
+
+failed = 0
+for id in argsDict["ids"]:
+    if send_notification(argsDict["webhookUrl"], argsDict["kind"], id, argsDict["secret"]):
+        print(f"Notified {argsDict['kind']} {id}.")
+    else:
+        failed += 1
+
+if failed > 0:
+    sys.exit(1)
@@ -10,13 +10,15 @@ from pathlib import Path
 import urllib.request
 import urllib.error
 import json
+import hashlib
+import warnings
 from argparse import ArgumentParser
 import zipfile
 
 os.chdir(Path(__file__).parents[1].absolute())
+# jsonschema is only imported once a variant actually needs to be validated, see get_schema_validator
 sys.path.insert(0, os.path.abspath("schema/six"))
 sys.path.insert(0, os.path.abspath("schema/"))
-import jsonschema
 
 # ################################ #
 # RapidCompact.Cloud API endpoints #
@@ -66,28 +68,115 @@ def execute_server_request(request):
     return response, response.getcode()
 
 
-def validate_json_with_api_schema(variant_config, schema_file, silent):
-    try:
+# validators are built once per schema file (as long as it isn't modified), and the result for
+# each distinct variant configuration is remembered, together with the validation report -
+# in memory, and in <cacheDir>/validation/ for later runs (shared with rpdc.py)
+schema_hashes = {}  # (path, mtime, size) -> schema hash
+schema_validators = {}  # schema hash -> validator
+validation_results = {}  # (schema hash, variant config hash) -> (valid, report)
+
+
+def get_schema_hash(schema_file):
+    file_stat = os.stat(schema_file)
+    key = (os.path.abspath(schema_file), file_stat.st_mtime_ns, file_stat.st_size)
+    if key not in schema_hashes:
+        with open(schema_file, "rb") as file:
+            schema_hashes[key] = hashlib.sha256(file.read()).hexdigest()
+    return schema_hashes[key]
+
+
+def get_schema_validator(schema_file, schema_hash):
+    if schema_hash not in schema_validators:
+        import jsonschema
         with open(schema_file) as file:
             schema = json.load(file)
-    except (OSError, json.JSONDecodeError):
-        if not silent:
-            print(
-                f"Error: Unable to validate configuration against schema: "
-                f"schema couldn't be read from file \"{schema_file}\".")
-        return False
+        # like jsonschema.validate, fall back to the latest draft for unknown $schema versions (quietly)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        schema_validators[schema_hash] = validator_class(schema)
+    return schema_validators[schema_hash]
+
+
+def canonical_json_hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+
+def validation_result_path(key):
+    return os.path.join(cache_dir, "validation", key[0], key[1] + ".json")
+
+
+def load_validation_result(key):
+    try:
+        with open(validation_result_path(key)) as file:
+            result_json = json.load(file)
+        return result_json["valid"], result_json["report"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
+
+def store_validation_result(key, result):
+    # write to a temporary file first, so that a crash never leaves a broken file behind
+    path = validation_result_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as file:
+            json.dump({"valid": result[0], "report": result[1]}, file)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
+def validate_json_with_api_schema(variant_config, schema_file, silent):
     try:
-        jsonschema.validate(variant_config, schema)
+        key = (get_schema_hash(schema_file), canonical_json_hash(variant_config))
+    except OSError:
+        key = None
+
+    result = validation_results.get(key) if key is not None else None
+    if result is None and key is not None and validation_cache_enabled:
+        result = load_validation_result(key)
+
+    if result is None:
+        try:
+            validator = get_schema_validator(schema_file, key[0]) if key is not None else None
+        except (OSError, ValueError):
+            validator = None
+        except Exception as e:
+            # the schema itself is invalid
+            validator = e
+
+        if validator is None:
+            if not silent:
+                print(
+                    f"Error: Unable to validate configuration against schema: "
+                    f"schema couldn't be read from file \"{schema_file}\".")
+            return False
+
+        if isinstance(validator, Exception):
+            result = (False, str(validator))
+        else:
+            import jsonschema
+            error = jsonschema.exceptions.best_match(validator.iter_errors(variant_config))
+            result = (error is None, str(error) if error is not None else None)
+
+        if validation_cache_enabled:
+            store_validation_result(key, result)
+
+    validation_results[key] = result
+
+    valid, report = result
+    if valid:
         if not silent:
             print("Variant configuration passed validation.")
         return True
-    except Exception as e:
-        if not silent:
-            print("Error: Variant configuration is not valid - see JSON validation report on how to fix this:")
-            print("********************************************************************************")
-            print(e)
-            print("********************************************************************************")
+
+    if not silent:
+        print("Error: Variant configuration is not valid - see JSON validation report on how to fix this:")
+        print("********************************************************************************")
+        print(report)
+        print("********************************************************************************")
 
     return False
 
@@ -190,6 +279,8 @@ except(OSError, json.JSONDecodeError):
 
 # Load Settings
 schema_json_path = settings["schemaPath"]
+cache_dir = settings.get("cacheDir", ".rpdc-cache")
+validation_cache_enabled = settings.get("validationCache", {}).get("enabled", True)
 
 # obtain token from credentials file
 access_token = user_credentials["token"]